@@ -1,11 +1,504 @@
+import time
+STARTED = time.perf_counter()  # before the other imports, so they count toward startup
+
+import argparse
+import getpass
+import json
 import tkinter as tk
-from tkinter import ttk, messagebox, font
+from tkinter import ttk, messagebox, font, filedialog
+import math
+import os
+import platform
+import queue
 import random
-import time
+import sys
 import threading
+from array import array
+from collections import deque
+from contextlib import contextmanager
+from itertools import repeat
+import typing_engine
+import adaptive
+from corpus import Corpus
+from history import ResultsStore
+import history
+import journal
+from metrics import GameMetrics, MetricsExporter
+from profiling import PhaseTimer, Profiler, StallMonitor
+from race_server import RaceClient
+from typing_engine import GhostPlayer, GhostTrack, TypingSession
+
+FONT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".local", "share", "typing-speed-game", "fonts.json")
+
+# Preferred families per font role, best first
+FONT_FAMILIES = {
+    "display": ("SF Pro Display", "Segoe UI", "Helvetica Neue", "Arial", "DejaVu Sans", "Helvetica"),
+    "text": ("SF Pro Text", "Segoe UI", "Helvetica Neue", "Arial", "DejaVu Sans", "Helvetica"),
+    "mono": ("SF Mono", "Menlo", "Consolas", "DejaVu Sans Mono", "Courier New", "Courier"),
+}
+
+class FontRegistry:
+    """Shared Font objects, with each role's family resolved once
+    
+    Tk quietly substitutes another family when the requested one is not
+    installed, so candidates are checked by asking Tk which family it
+    actually used rather than listing every installed font. The winners are
+    cached on disk per windowing system; on later launches a cached family
+    costs a single check. Each (role, size, weight) is created once and
+    shared by every widget, so dialogs do not leave named fonts behind.
+    """
+    def __init__(self, root, cache_path=FONT_CACHE_PATH):
+        self.root = root
+        self.cache_path = cache_path
+        self.system = root.tk.call("tk", "windowingsystem")
+        self.fonts = {}
+        self.families = {}
+        self.cached = self.load_cache()
+        self.dirty = False
+    
+    def load_cache(self):
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                return json.load(f).get(self.system, {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+    
+    def available(self, family):
+        """Whether Tk renders family itself rather than a substitute"""
+        probe = font.Font(root=self.root, family=family, size=12)
+        return probe.actual("family").lower() == family.lower()
+    
+    def family(self, role):
+        if role not in self.families:
+            candidates = FONT_FAMILIES[role]
+            key = "|".join(candidates)
+            cached = self.cached.get(key)
+            if cached and self.available(cached):
+                family = cached
+            else:
+                family = next((c for c in candidates if self.available(c)), candidates[-1])
+                self.cached[key] = family
+                self.dirty = True
+            self.families[role] = family
+        return self.families[role]
+    
+    def get(self, role, size, weight="normal"):
+        """The shared font for a role at this size and weight"""
+        key = (role, size, weight)
+        if key not in self.fonts:
+            self.fonts[key] = font.Font(root=self.root, family=self.family(role), size=size, weight=weight)
+        return self.fonts[key]
+    
+    def save(self):
+        """Remember newly resolved families for the next launch"""
+        if not self.dirty:
+            return
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        data[self.system] = self.cached
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.cache_path)
+            self.dirty = False
+        except OSError:
+            pass
+
+class TextHighlighter:
+    """Apply correct/incorrect/current tags to a Text widget incrementally
+
+    Remembers what is already on screen so each render only touches the
+    range invalidated since the last one, and tags contiguous runs of
+    correct or incorrect characters with a single range each. Multi-line
+    passages get a precomputed offset -> line.column table so indices stay
+    O(1) however long the text; single-line passages (the only kind that
+    is extended or shifted, in endless mode) index line 1 directly.
+    """
+    def __init__(self, widget):
+        self.widget = widget
+        self.reset()
+    
+    def reset(self, text=""):
+        """Forget rendered state, e.g. after the widget content was replaced"""
+        self.rendered_length = 0
+        self.current_offset = None
+        self.dirty_start = None
+        self.dirty_end = 0
+        self.markers = {}
+        self.lines = None
+        self.columns = None
+        if "\n" in text:
+            # One entry per offset, plus one for the end of the text
+            self.lines = array("I")
+            self.columns = array("I")
+            for number, line in enumerate(text.split("\n"), 1):
+                self.lines.extend(repeat(number, len(line) + 1))
+                self.columns.extend(range(len(line) + 1))
+    
+    def index(self, offset):
+        """Text index for a character offset into the passage"""
+        if self.lines is None:
+            return f"1.{offset}"
+        return f"{self.lines[offset]}.{self.columns[offset]}"
+    
+    def shift(self, count):
+        """Account for count characters deleted from the start of the widget"""
+        self.rendered_length = max(0, self.rendered_length - count)
+        if self.current_offset is not None:
+            self.current_offset = max(0, self.current_offset - count)
+        if self.dirty_start is not None:
+            self.dirty_start = max(0, self.dirty_start - count)
+            self.dirty_end = max(0, self.dirty_end - count)
+        for tag, offset in self.markers.items():
+            self.markers[tag] = max(0, offset - count)
+    
+    def invalidate(self, start, end):
+        """Mark the offsets in [start, end) as needing a redraw"""
+        if self.dirty_start is None or start < self.dirty_start:
+            self.dirty_start = start
+        if end > self.dirty_end:
+            self.dirty_end = end
+    
+    def render(self, matches, typed_length, text_length):
+        """Redraw the invalidated range from the scorer's marks up to its cursor"""
+        widget = self.widget
+        
+        if self.dirty_start is not None:
+            start = min(self.dirty_start, text_length)
+            end = min(max(self.dirty_end, self.rendered_length), text_length)
+            if start < end:
+                widget.tag_remove("correct", self.index(start), self.index(end))
+                widget.tag_remove("incorrect", self.index(start), self.index(end))
+            
+            # Collect runs so each tag is applied with one call
+            runs = {1: [], 0: []}
+            pos = start
+            stop = min(end, typed_length)
+            while pos < stop:
+                value = matches[pos]
+                run_end = matches.find(1 - value, pos, stop)
+                if run_end == -1:
+                    run_end = stop
+                runs[value].extend((self.index(pos), self.index(run_end)))
+                pos = run_end
+            if runs[1]:
+                widget.tag_add("correct", *runs[1])
+            if runs[0]:
+                widget.tag_add("incorrect", *runs[0])
+            
+            self.dirty_start = None
+            self.dirty_end = 0
+        self.rendered_length = min(typed_length, text_length)
+        
+        # Move the current character marker only when it actually moved
+        if self.current_offset != typed_length:
+            if self.current_offset is not None and self.current_offset < text_length:
+                widget.tag_remove("current", self.index(self.current_offset), self.index(self.current_offset + 1))
+            if typed_length < text_length:
+                widget.tag_add("current", self.index(typed_length), self.index(typed_length + 1))
+            if self.lines is not None:
+                # Long passages scroll to follow the cursor
+                widget.see(self.index(min(typed_length, text_length)))
+            self.current_offset = typed_length
+    
+    def move_marker(self, tag, offset, text_length):
+        """Put a one-character marker tag at offset, touching the widget only if it moved"""
+        previous = self.markers.get(tag)
+        if previous == offset:
+            return
+        if previous is not None and previous < text_length:
+            self.widget.tag_remove(tag, self.index(previous), self.index(previous + 1))
+        if offset < text_length:
+            self.widget.tag_add(tag, self.index(offset), self.index(offset + 1))
+        self.markers[tag] = offset
+
+class CountdownTimer:
+    """Countdown driven by the Tk event loop against a monotonic deadline
+
+    Remaining time is always derived from the deadline, so late callbacks
+    never accumulate drift, and every callback runs on the Tk main thread.
+    Ticks are aligned to multiples of the interval before the deadline.
+    Started without a duration it counts up and never expires.
+    """
+    def __init__(self, root, on_tick, on_expire, interval=1.0):
+        self.root = root
+        self.on_tick = on_tick
+        self.on_expire = on_expire
+        self.interval = interval
+        self.started_at = None
+        self.deadline = None
+        self.after_id = None
+    
+    @property
+    def running(self):
+        return self.after_id is not None
+    
+    def start(self, duration, elapsed=0.0):
+        """(Re)start the countdown, cancelling any pending tick"""
+        self.cancel()
+        self.started_at = time.monotonic() - elapsed
+        self.deadline = None if duration is None else self.started_at + duration
+        self._tick()
+    
+    def cancel(self):
+        """Stop the countdown without firing on_expire"""
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+    
+    def elapsed(self):
+        """Seconds since the timer was started"""
+        if self.started_at is None:
+            return 0.0
+        return time.monotonic() - self.started_at
+    
+    def remaining(self):
+        """Seconds left before the deadline"""
+        if self.started_at is None:
+            return 0.0
+        if self.deadline is None:
+            return math.inf
+        return max(0.0, self.deadline - time.monotonic())
+    
+    def _tick(self):
+        self.after_id = None
+        remaining = self.remaining()
+        self.on_tick(remaining)
+        if remaining <= 0:
+            self.on_expire()
+            return
+        
+        # Wake up on the next interval boundary rather than a fixed delay later
+        if self.deadline is None:
+            delay = self.interval - self.elapsed() % self.interval
+        else:
+            delay = remaining % self.interval or self.interval
+        self.after_id = self.root.after(max(1, math.ceil(delay * 1000)), self._tick)
+
+class RenderScheduler:
+    """Coalesce UI refresh requests into at most one flush per frame
+
+    Requests made while a flush is already pending are dropped, and
+    flushes are spaced at least one frame apart, so a burst of keystrokes
+    inside one frame costs a single redraw.
+    """
+    def __init__(self, root, flush, fps=60):
+        self.root = root
+        self.flush = flush
+        self.frame_interval = 1.0 / fps
+        self.last_flush = -math.inf
+        self.after_id = None
+    
+    def request(self):
+        """Schedule a flush unless one is already pending"""
+        if self.after_id is not None:
+            return
+        delay = self.last_flush + self.frame_interval - time.monotonic()
+        if delay <= 0:
+            self.after_id = self.root.after_idle(self._flush)
+        else:
+            self.after_id = self.root.after(max(1, math.ceil(delay * 1000)), self._flush)
+    
+    def cancel(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+    
+    def flush_now(self):
+        """Flush immediately, replacing any pending flush"""
+        self.cancel()
+        self._flush()
+    
+    def _flush(self):
+        self.after_id = None
+        self.last_flush = time.monotonic()
+        self.flush()
+
+class InputPipeline:
+    """Observe every edit to an Entry exactly once, timestamped on arrival
+
+    Uses the Entry's key validation hook, which Tk runs for each insert
+    and delete as it happens (typed keys, autorepeat, pastes, IME commits),
+    rather than polling the contents on key release. Edits are queued as
+    (timestamp, edit_start, new_text) and handed to consume in order once
+    the event loop is idle, followed by one on_batch call. The hook must
+    not touch the Entry itself, or Tk switches validation off.
+    """
+    def __init__(self, widget, consume, on_batch):
+        self.widget = widget
+        self.consume = consume
+        self.on_batch = on_batch
+        self.queue = deque()
+        self.paused = False
+        self.after_id = None
+        self.install()
+    
+    def install(self):
+        command = (self.widget.register(self._on_edit), "%i", "%P")
+        self.widget.config(validate="key", validatecommand=command)
+    
+    def _on_edit(self, index, new_text):
+        self.push(int(index), new_text)
+        return True
+    
+    def push(self, edit_start, new_text):
+        """Queue one edit for the next idle drain"""
+        if not self.paused:
+            self.queue.append((time.monotonic(), edit_start, new_text))
+            if self.after_id is None:
+                self.after_id = self.widget.after_idle(self._drain)
+    
+    @contextmanager
+    def suppressed(self):
+        """Make programmatic edits to the Entry without queueing them"""
+        self.paused = True
+        try:
+            yield
+        finally:
+            self.paused = False
+    
+    def clear(self):
+        """Drop queued edits that have not been consumed yet"""
+        self.queue.clear()
+    
+    def reset(self, text=""):
+        """Replace the widget's contents and drop queued edits"""
+        with self.suppressed():
+            self.widget.delete(0, "end")
+            self.widget.insert(0, text)
+        self.clear()
+    
+    def _drain(self):
+        self.after_id = None
+        queue = self.queue
+        while queue:
+            self.consume(*queue.popleft())
+        self.on_batch()
+
+class TextInputPipeline(InputPipeline):
+    """InputPipeline for a multi-line Text widget, where Enter and Tab are typed
+    
+    Text has no validation hook, so the widget's Tcl command is wrapped to
+    see every insert and delete as Tk's bindings issue it. The contents are
+    mirrored in a string, so each edit is reported with the full new text
+    without reading the widget back.
+    """
+    def install(self):
+        self.content = ""
+        widget = self.widget
+        self.original = widget._w + "_original"
+        widget.tk.call("rename", widget._w, self.original)
+        widget.tk.createcommand(widget._w, self._on_command)
+    
+    def offset(self, index):
+        """Character offset of a Text index"""
+        return int(self.widget.tk.call(self.original, "count", "-chars", "1.0", index) or 0)
+    
+    def _on_command(self, *args):
+        call = self.widget.tk.call
+        command = args[0] if args else ""
+        if command not in ("insert", "delete", "replace") or str(call(self.original, "cget", "-state")) == "disabled":
+            # Disabled Text ignores edits, so there is nothing to mirror
+            return call((self.original,) + args)
+        if command == "insert":
+            start = min(self.offset(args[1]), len(self.content))
+            result = call((self.original,) + args)
+            self.content = self.content[:start] + "".join(args[2::2]) + self.content[start:]
+        elif command == "delete" and len(args) <= 3:
+            start = min(self.offset(args[1]), len(self.content))
+            end = self.offset(args[2]) if len(args) == 3 else start + 1
+            result = call((self.original,) + args)
+            if end > start:
+                self.content = self.content[:start] + self.content[end:]
+        else:
+            # Multi-range edits are rare enough to simply re-read
+            result = call((self.original,) + args)
+            start = None
+            self.content = call(self.original, "get", "1.0", "end-1c")
+        self.push(start, self.content)
+        return result
+    
+    def reset(self, text=""):
+        with self.suppressed():
+            self.widget.delete("1.0", "end")
+            self.widget.insert("1.0", text)
+        self.clear()
+
+class PassagePool:
+    """Passages for the selected settings, generated ahead on a background thread
+
+    Keeps up to size passages ready for one settings key. Selecting a
+    different key drops them and refills for the new one; passages that
+    were still being generated for an old key are discarded on arrival.
+    The generate(key, rng) callback runs on the pool's thread; if it raises,
+    the pool stops trying that key until another one is selected, and take
+    returns None so the caller generates inline and sees the error itself.
+    """
+    def __init__(self, generate, size=2):
+        self.generate = generate
+        self.size = size
+        self.key = None
+        self.failed = False  # generate raised for the current key
+        self.ready = deque()
+        self.generation = 0
+        self.closed = False
+        self.wanted = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name="passage-pool", daemon=True)
+        self.thread.start()
+    
+    def select(self, key):
+        """Generate for key from now on; None pauses the pool"""
+        with self.wanted:
+            if key != self.key:
+                self.key = key
+                self.failed = False
+                self.ready.clear()
+                self.generation += 1
+                self.wanted.notify()
+    
+    def take(self, key):
+        """A ready passage for key, or None if there is none yet"""
+        with self.wanted:
+            if key != self.key or not self.ready:
+                return None
+            self.wanted.notify()
+            return self.ready.popleft()
+    
+    def close(self):
+        with self.wanted:
+            self.closed = True
+            self.wanted.notify()
+    
+    def _run(self):
+        rng = random.Random()
+        while True:
+            with self.wanted:
+                while not self.closed and (self.key is None or self.failed or len(self.ready) >= self.size):
+                    self.wanted.wait()
+                if self.closed:
+                    return
+                key, generation = self.key, self.generation
+            try:
+                passage = self.generate(key, rng)
+            except Exception:
+                with self.wanted:
+                    if generation == self.generation:
+                        self.failed = True
+                continue
+            with self.wanted:
+                if generation == self.generation:
+                    self.ready.append(passage)
 
 class TypingSpeedGame:
-    def __init__(self, root):
+    def __init__(self, root, corpus=None, store=None, user=None, fps=60,
+                 profile=False, profile_dump=None, race=None, record_dir=None, code_path=None,
+                 journal_dir=None, startup=None, metrics=None):
+        self.startup = startup or PhaseTimer()
         self.root = root
         self.root.title("⚡ Typing Speed Master")
         self.root.geometry("1000x700")
@@ -19,62 +512,148 @@ class TypingSpeedGame:
             pass
             
         # Configure modern styling
-        self.setup_styles()
+        with self.startup.phase("styles"):
+            self.setup_styles()
         
         # Game variables
         self.current_text = ""
-        self.start_time = None
-        self.end_time = None
         self.time_limit = 120  # Default 2 minutes
+        self.endless = False
         self.timer_running = False
         self.remaining_time = 0
-        self.correct_chars = 0
-        self.total_chars = 0
-        self.current_position = 0
-        
-        # Word lists for different difficulty levels
-        self.word_lists = {
-            "Easy": [
-                "cat", "dog", "run", "jump", "walk", "talk", "book", "read", "write", "play",
-                "game", "time", "work", "home", "food", "love", "life", "help", "good", "best",
-                "make", "take", "come", "look", "feel", "know", "think", "first", "last", "find",
-                "give", "hand", "part", "place", "right", "great", "small", "large", "world", "state"
-            ],
-            "Medium": [
-                "computer", "keyboard", "monitor", "programming", "development", "application", "function",
-                "variable", "language", "algorithm", "structure", "database", "network", "security",
-                "interface", "technology", "innovation", "creativity", "productivity", "efficiency",
-                "organization", "management", "communication", "collaboration", "implementation",
-                "optimization", "configuration", "documentation", "maintenance", "troubleshooting"
-            ],
-            "Hard": [
-                "extraordinary", "incomprehensible", "disproportionate", "responsibilities", "characteristics",
-                "administration", "transformation", "establishment", "implementation", "acknowledgment",
-                "representative", "infrastructure", "standardization", "internationalization",
-                "multidisciplinary", "telecommunications", "entrepreneurship", "simultaneously",
-                "consciousness", "philosophical", "psychological", "technological", "environmental",
-                "organizational", "constitutional", "revolutionary", "extraordinary", "fundamentally"
-            ]
-        }
-        
-        self.setup_ui()
+        self.timer = CountdownTimer(self.root, self.on_timer_tick, self.on_time_up)
+        self.renderer = RenderScheduler(self.root, self.render_frame, fps)
+        self.label_texts = {}
+        self.session = None
+        self.corpus = corpus or typing_engine.DEFAULT_CORPUS
+        self.store = store
+        self.user = user or getpass.getuser()
+        with self.startup.phase("typing_stats"):
+            self.typing_stats = adaptive.TypingStats.load()
+        self.adaptive = adaptive.AdaptiveGenerator(self.corpus, self.typing_stats)
+        self.passages = PassagePool(self.build_passage)
+        self.passage_key = None
+        self.record_dir = record_dir
+        self.race = race
+        self.race_id = None
+        self.race_names = {}
+        self.race_positions = {}
+        self.ghost_track = None
+        self.ghost_player = None
+        self.watching_ghost = False
+        self.ghost_scrub_value = 0.0
+        self.code_path = None
+        self.code_lines = None
+        self.journal_dir = journal_dir
+        self.journal = None
+        self.results_dialog = None
+        self.metrics = metrics
+        
+        with self.startup.phase("ui"):
+            self.setup_ui()
+        self.setup_profiling(profile, profile_dump)
+        if code_path and self.load_code(code_path):
+            self.code_var.set(True)
+        
+        # Upcoming passages are generated while the player reads or types
+        for var in (self.difficulty_var, self.time_var, self.adaptive_var):
+            var.trace_add("write", self.refresh_passages)
+        self.refresh_passages()
+        
+        if self.journal_dir and not self.race:
+            self.root.after_idle(self.offer_resume)
+        self.root.after_idle(self.on_ready)
+    
+    def on_ready(self):
+        """Finish startup work that can wait until the window is up"""
+        self.startup.mark("ready")
+        if self.profiler.enabled:
+            print(f"startup\n{self.startup.format()}", file=sys.stderr)
+        self.fonts.save()
+        # Built now so the end of the first game does not pay for it
+        if self.results_dialog is None:
+            self.build_results_dialog()
+    
+    def setup_profiling(self, enabled, dump_dir):
+        """Instrument the per-key stages; F12 toggles the latency overlay"""
+        self.profiler = Profiler()
+        self.profile_dump_dir = dump_dir
+        # Both pipelines, since use_input swaps them per passage
+        self.profiler.instrument(self.entry_input, "consume", "input")
+        self.profiler.instrument(self.text_input, "consume", "input")
+        self.profiler.instrument(self.renderer, "flush", "frame")
+        self.profiler.instrument(self, "update_display", "update_display")
+        self.profiler.instrument(self, "highlight_text", "highlight_text")
+        self.stall_monitor = StallMonitor(self.root, self.profiler.histogram("loop_stall"))
+        
+        self.profile_overlay = tk.Label(
+            self.root,
+            font=self.fonts.get("mono", 10),
+            bg=self.colors['bg_tertiary'],
+            fg=self.colors['text_primary'],
+            justify="left",
+            padx=10,
+            pady=5
+        )
+        self.overlay_after_id = None
+        self.root.bind("<F12>", self.toggle_profile_overlay)
+        
+        # The metrics exporter reads keystroke latency and stalls from here
+        if self.metrics:
+            self.metrics.profiler = self.profiler
+        self.profile_always = enabled or bool(self.metrics)
+        if self.profile_always:
+            self.profiler.enable()
+            self.stall_monitor.start()
+    
+    def toggle_profile_overlay(self, event=None):
+        """Show or hide live p50/p95/p99 per stage, profiling while shown"""
+        if self.overlay_after_id is not None:
+            self.root.after_cancel(self.overlay_after_id)
+            self.overlay_after_id = None
+            self.profile_overlay.place_forget()
+            # Back to zero cost unless --profile or the metrics exporter wants timings
+            if not self.profile_always:
+                self.profiler.disable()
+                self.stall_monitor.stop()
+            return
+        self.profiler.enable()
+        self.stall_monitor.start()
+        self.profile_overlay.place(relx=1.0, x=-10, y=10, anchor="ne")
+        self.refresh_profile_overlay()
+    
+    def refresh_profile_overlay(self):
+        lines = [f"{'stage':<15}{'p50':>9}{'p95':>9}{'p99':>9}"]
+        for stage, percentiles in self.profiler.summary().items():
+            lines.append(f"{stage:<15}" + "".join(f"{p * 1000:>7.2f}ms" for p in percentiles))
+        self.profile_overlay.config(text="\n".join(lines))
+        self.overlay_after_id = self.root.after(500, self.refresh_profile_overlay)
+    
+    def dump_profile(self, result):
+        """Write this game's latency histograms for offline diagnosis"""
+        os.makedirs(self.profile_dump_dir, exist_ok=True)
+        path = os.path.join(self.profile_dump_dir, f"profile-{int(time.time() * 1000)}.json")
+        self.profiler.dump(
+            path,
+            host=platform.node(),
+            user=self.user,
+            difficulty=self.session.difficulty,
+            time_limit=self.time_limit,
+            wpm=result.wpm,
+            accuracy=result.accuracy,
+            elapsed_time=result.elapsed_time,
+            startup_ms=self.startup.to_dict(),
+        )
     
     def setup_styles(self):
         """Setup modern styling and fonts"""
-        # Create custom fonts
-        try:
-            self.title_font = font.Font(family="SF Pro Display", size=28, weight="bold")
-            self.heading_font = font.Font(family="SF Pro Display", size=16, weight="bold")
-            self.body_font = font.Font(family="SF Pro Text", size=12)
-            self.mono_font = font.Font(family="SF Mono", size=14)
-            self.stat_font = font.Font(family="SF Pro Display", size=14, weight="bold")
-        except:
-            # Fallback fonts for cross-platform compatibility
-            self.title_font = font.Font(family="Arial", size=28, weight="bold")
-            self.heading_font = font.Font(family="Arial", size=16, weight="bold")
-            self.body_font = font.Font(family="Arial", size=12)
-            self.mono_font = font.Font(family="Courier", size=14)
-            self.stat_font = font.Font(family="Arial", size=14, weight="bold")
+        # Shared fonts, falling back to whatever families are installed
+        self.fonts = FontRegistry(self.root)
+        self.title_font = self.fonts.get("display", 28, "bold")
+        self.heading_font = self.fonts.get("display", 16, "bold")
+        self.body_font = self.fonts.get("text", 12)
+        self.mono_font = self.fonts.get("mono", 14)
+        self.stat_font = self.fonts.get("display", 14, "bold")
         
         # Configure ttk styles
         style = ttk.Style()
@@ -207,7 +786,7 @@ class TypingSpeedGame:
         time_combo = ttk.Combobox(
             time_frame, 
             textvariable=self.time_var,
-            values=["2 minutes", "3 minutes"],
+            values=["2 minutes", "3 minutes", "Endless"],
             state="readonly",
             width=12,
             font=self.body_font,
@@ -215,6 +794,51 @@ class TypingSpeedGame:
         )
         time_combo.pack(pady=(5, 0))
         
+        # Adaptive practice toggle
+        adaptive_frame = tk.Frame(controls_frame, bg=self.colors['bg_secondary'])
+        adaptive_frame.pack(side="left", padx=(0, 40))
+        
+        self.adaptive_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            adaptive_frame,
+            text="🧠 Adaptive practice",
+            variable=self.adaptive_var,
+            font=self.body_font,
+            bg=self.colors['bg_secondary'],
+            fg=self.colors['text_primary'],
+            selectcolor=self.colors['bg_tertiary'],
+            activebackground=self.colors['bg_secondary'],
+            activeforeground=self.colors['text_primary']
+        ).pack(anchor="w", pady=(20, 0))
+        
+        self.code_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            adaptive_frame,
+            text="💻 Code snippets",
+            variable=self.code_var,
+            command=self.on_code_toggle,
+            font=self.body_font,
+            bg=self.colors['bg_secondary'],
+            fg=self.colors['text_primary'],
+            selectcolor=self.colors['bg_tertiary'],
+            activebackground=self.colors['bg_secondary'],
+            activeforeground=self.colors['text_primary']
+        ).pack(anchor="w", pady=(5, 0))
+        
+        # Skipped or doubled keys cost one error instead of shifting the rest
+        self.aligned_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(
+            adaptive_frame,
+            text="🧩 Forgive skipped keys",
+            variable=self.aligned_var,
+            font=self.body_font,
+            bg=self.colors['bg_secondary'],
+            fg=self.colors['text_primary'],
+            selectcolor=self.colors['bg_tertiary'],
+            activebackground=self.colors['bg_secondary'],
+            activeforeground=self.colors['text_primary']
+        ).pack(anchor="w", pady=(5, 0))
+        
         # Start button with modern styling
         button_frame = tk.Frame(controls_frame, bg=self.colors['bg_secondary'])
         button_frame.pack(side="right")
@@ -236,6 +860,126 @@ class TypingSpeedGame:
         )
         self.start_button.pack()
         
+        if self.store:
+            tk.Button(
+                button_frame,
+                text="🏆 History",
+                font=self.body_font,
+                bg=self.colors['bg_tertiary'],
+                fg="white",
+                command=self.show_history_dialog,
+                padx=20,
+                pady=5,
+                border=0,
+                cursor="hand2",
+                activebackground=self.colors['accent_hover'],
+                activeforeground="white",
+                relief="flat"
+            ).pack(fill="x", pady=(10, 0))
+            tk.Button(
+                button_frame,
+                text="📈 Progress",
+                font=self.body_font,
+                bg=self.colors['bg_tertiary'],
+                fg="white",
+                command=self.show_progress_dialog,
+                padx=20,
+                pady=5,
+                border=0,
+                cursor="hand2",
+                activebackground=self.colors['accent_hover'],
+                activeforeground="white",
+                relief="flat"
+            ).pack(fill="x", pady=(10, 0))
+            self.poll_store()
+        
+        tk.Button(
+            button_frame,
+            text="👻 Race Ghost",
+            font=self.body_font,
+            bg=self.colors['bg_tertiary'],
+            fg="white",
+            command=self.load_ghost,
+            padx=20,
+            pady=5,
+            border=0,
+            cursor="hand2",
+            activebackground=self.colors['accent_hover'],
+            activeforeground="white",
+            relief="flat"
+        ).pack(fill="x", pady=(10, 0))
+        
+        # Ghost replay controls, shown once a recording is loaded
+        self.ghost_frame = tk.Frame(settings_content, bg=self.colors['bg_secondary'])
+        
+        self.ghost_label = tk.Label(
+            self.ghost_frame,
+            text="👻 Ghost",
+            font=self.body_font,
+            bg=self.colors['bg_secondary'],
+            fg=self.colors['text_primary']
+        )
+        self.ghost_label.pack(side="left", padx=(0, 20))
+        
+        self.ghost_speed_var = tk.StringVar(value="1x")
+        ghost_speed_combo = ttk.Combobox(
+            self.ghost_frame,
+            textvariable=self.ghost_speed_var,
+            values=["0.5x", "1x", "2x", "4x"],
+            state="readonly",
+            width=5,
+            font=self.body_font,
+            style='Modern.TCombobox'
+        )
+        ghost_speed_combo.pack(side="left", padx=(0, 20))
+        ghost_speed_combo.bind("<<ComboboxSelected>>", self.on_ghost_speed)
+        
+        self.ghost_scrub = tk.Scale(
+            self.ghost_frame,
+            from_=0,
+            to=1,
+            resolution=0.1,
+            orient="horizontal",
+            showvalue=False,
+            command=self.on_ghost_scrub,
+            bg=self.colors['bg_secondary'],
+            troughcolor=self.colors['bg_tertiary'],
+            highlightthickness=0,
+            border=0
+        )
+        self.ghost_scrub.pack(side="left", fill="x", expand=True, padx=(0, 20))
+        
+        self.ghost_watch_button = tk.Button(
+            self.ghost_frame,
+            text="▶ Watch",
+            font=self.body_font,
+            bg=self.colors['bg_tertiary'],
+            fg="white",
+            command=self.watch_ghost,
+            padx=10,
+            border=0,
+            cursor="hand2",
+            activebackground=self.colors['accent_hover'],
+            activeforeground="white",
+            relief="flat"
+        )
+        self.ghost_watch_button.pack(side="left", padx=(0, 5))
+        
+        tk.Button(
+            self.ghost_frame,
+            text="✖",
+            font=self.body_font,
+            bg=self.colors['bg_tertiary'],
+            fg="white",
+            command=self.clear_ghost,
+            padx=10,
+            border=0,
+            cursor="hand2",
+            activebackground=self.colors['accent_hover'],
+            activeforeground="white",
+            relief="flat"
+        ).pack(side="left")
+        
         # Timer section with circular design concept
         timer_frame = tk.Frame(main_container, bg=self.colors['bg_secondary'])
         timer_frame.pack(fill="x", pady=(0, 20))
@@ -249,12 +993,25 @@ class TypingSpeedGame:
         self.timer_label = tk.Label(
             timer_content,
             text="⏰ Time: 2:00",
-            font=font.Font(family="Arial", size=20, weight="bold"),
+            font=self.fonts.get("display", 20, "bold"),
             bg=self.colors['bg_secondary'],
             fg=self.colors['warning']
         )
         self.timer_label.pack()
         
+        if self.race:
+            # Opponents' progress, updated from the race server's ticks
+            self.race_label = tk.Label(
+                timer_content,
+                text="🏁 Connecting to race server...",
+                font=self.body_font,
+                bg=self.colors['bg_secondary'],
+                fg=self.colors['text_secondary']
+            )
+            self.race_label.pack(pady=(5, 0))
+            self.start_button.config(text="🏁 Join Race", command=self.ready_for_race)
+            self.poll_race()
+        
         # Text display section with modern card design
         text_card = tk.Frame(main_container, bg=self.colors['bg_secondary'], relief="flat")
         text_card.pack(fill="both", expand=True, pady=(0, 20))
@@ -309,6 +1066,9 @@ class TypingSpeedGame:
         self.text_display.tag_configure("correct", background=self.colors['success'], foreground="white", relief="flat")
         self.text_display.tag_configure("incorrect", background=self.colors['error'], foreground="white", relief="flat")
         self.text_display.tag_configure("current", background=self.colors['accent'], foreground="white", relief="flat")
+        self.text_display.tag_configure("ghost", background=self.colors['info'], foreground="white", underline=True)
+        self.text_display.tag_lower("ghost", "current")
+        self.highlighter = TextHighlighter(self.text_display)
         
         # Input section with modern styling
         input_card = tk.Frame(main_container, bg=self.colors['bg_secondary'])
@@ -340,7 +1100,27 @@ class TypingSpeedGame:
             relief="flat"
         )
         self.input_entry.pack(fill="x", ipady=12)
-        self.input_entry.bind('<KeyRelease>', self.on_key_press)
+        self.entry_input = InputPipeline(self.input_entry, self.on_input, self.on_input_batch)
+        
+        # Multi-line input, swapped in for passages with line breaks or tabs
+        self.input_text = tk.Text(
+            input_content,
+            font=self.mono_font,
+            height=4,
+            wrap="none",
+            bg=self.colors['bg_tertiary'],
+            fg=self.colors['text_primary'],
+            state="disabled",
+            insertbackground=self.colors['accent'],
+            selectbackground=self.colors['accent'],
+            border=0,
+            padx=10,
+            pady=8,
+            relief="flat"
+        )
+        self.text_input = TextInputPipeline(self.input_text, self.on_input, self.on_input_batch)
+        self.input_widget = self.input_entry
+        self.input = self.entry_input
         
         # Stats section with cards
         stats_frame = tk.Frame(main_container, bg=self.colors['bg_primary'])
@@ -379,7 +1159,7 @@ class TypingSpeedGame:
         value_label = tk.Label(
             content,
             text=value,
-            font=font.Font(family="Arial", size=18, weight="bold"),
+            font=self.fonts.get("display", 18, "bold"),
             bg=self.colors['bg_secondary'],
             fg=color
         )
@@ -395,167 +1175,362 @@ class TypingSpeedGame:
         
     def generate_text(self):
         """Generate random text based on difficulty level"""
-        difficulty = self.difficulty_var.get()
-        words = self.word_lists[difficulty]
-        
-        # Generate 50-80 words for the test
-        num_words = random.randint(50, 80)
-        selected_words = [random.choice(words) for _ in range(num_words)]
-        
-        return " ".join(selected_words)
+        key = self.passage_key or self.current_passage_key()
+        passage = self.passages.take(key)
+        if passage is None:
+            # Pool has not caught up yet, e.g. right after a settings change
+            passage = self.build_passage(key, random)
+        return passage
+    
+    def current_passage_key(self):
+        """Passage pool key describing the current settings"""
+        if self.code_var.get() and self.code_lines:
+            return ("code", self.code_path, self.time_var.get() == "Endless")
+        if self.adaptive_var.get():
+            # Weighted toward the bigrams this player struggles with
+            return ("adaptive", self.difficulty_var.get(), tuple(self.typing_stats.weakest_bigrams()))
+        return ("words", self.difficulty_var.get())
+    
+    def build_passage(self, key, rng):
+        """Generate a passage for a pool key; runs on the pool thread too"""
+        kind = key[0]
+        if kind == "code":
+            # Untimed code games type the whole file
+            return typing_engine.code_snippet(self.code_lines, None if key[2] else 30, rng)
+        if kind == "adaptive":
+            return self.adaptive.generate(key[1], rng, key[2])
+        return typing_engine.generate_text(key[1], rng, self.corpus)
+    
+    def refresh_passages(self, *args):
+        """Point the passage pool at the current settings"""
+        self.passage_key = self.current_passage_key()
+        # Endless word passages are streamed, so there is nothing to prepare
+        if self.passage_key[0] != "code" and self.time_var.get() == "Endless":
+            self.passage_key = None
+        self.passages.select(self.passage_key)
     
-    def start_game(self):
-        """Start the typing speed game"""
-        # Set time limit
+    def load_code(self, path):
+        """Use a source file for code snippets; False if it cannot be read"""
+        try:
+            self.code_lines = typing_engine.read_source(path)
+        except (OSError, ValueError) as exc:
+            messagebox.showerror("Code snippets", f"Could not load {path}:\n{exc}")
+            return False
+        self.code_path = path
+        self.refresh_passages()
+        return True
+    
+    def on_code_toggle(self):
+        """Pick a source file when code snippets are switched on"""
+        if self.code_var.get():
+            path = filedialog.askopenfilename(title="Choose a source file")
+            loaded = bool(path) and self.load_code(path)
+            if not loaded and not self.code_lines:
+                self.code_var.set(False)
+        self.refresh_passages()
+    
+    def start_game(self, text=None, time_limit=None):
+        """Start the typing speed game, optionally on a given passage"""
+        # A loaded ghost races on its own passage and time limit
+        ghost = text is None and self.ghost_track is not None
+        if ghost:
+            text = self.ghost_track.text
+            time_limit = self.ghost_track.time_limit
+        code = text is None and self.code_var.get() and bool(self.code_lines)
+        
+        # Set time limit; "Endless" code is the whole file, untimed
         time_setting = self.time_var.get()
-        self.time_limit = 120 if "2" in time_setting else 180
+        self.endless = text is None and time_setting == "Endless" and not code
+        if time_limit is not None:
+            self.time_limit = time_limit
+        elif time_setting == "Endless":
+            self.time_limit = 0
+        else:
+            self.time_limit = 120 if "2" in time_setting else 180
         self.remaining_time = self.time_limit
         
-        # Generate text
-        self.current_text = self.generate_text()
-        
-        # Reset variables
-        self.current_position = 0
-        self.correct_chars = 0
-        self.total_chars = 0
-        self.start_time = time.time()
-        
-        # Update UI
-        self.text_display.config(state="normal")
-        self.text_display.delete(1.0, "end")
-        self.text_display.insert(1.0, self.current_text)
-        self.text_display.config(state="disabled")
-        
-        self.input_entry.config(state="normal")
-        self.input_entry.delete(0, "end")
-        self.input_entry.focus()
-        
-        self.start_button.config(state="disabled", text="🎮 Game in Progress...", bg=self.colors['text_secondary'])
+        # Generate text and start a fresh session
+        difficulty = "Code" if code else self.difficulty_var.get()
+        scoring = "aligned" if self.aligned_var.get() and not self.endless else "positional"
+        try:
+            if text is not None:
+                session = TypingSession(text, self.time_limit, difficulty, scoring=scoring)
+            elif self.endless:
+                # Text is streamed in as the player approaches the end of the window
+                source = typing_engine.endless_text(difficulty, corpus=self.corpus)
+                session = TypingSession("", 0, difficulty, text_source=source)
+                session.refill()
+            else:
+                session = TypingSession(self.generate_text(), self.time_limit, difficulty, scoring=scoring)
+        except ValueError as exc:
+            # e.g. a --corpus file with no entries for this difficulty
+            messagebox.showerror("Start Game", f"Could not build a passage:\n{exc}")
+            return
+        self.session = session
+        self.session.start()
+        self.play_session(ghost)
+    
+    def resume_game(self, session):
+        """Carry on with a session restored from a journal"""
+        self.session = session
+        self.endless = session.endless
+        self.time_limit = session.time_limit
+        self.remaining_time = session.remaining_time()
+        self.play_session()
+    
+    def play_session(self, ghost=False):
+        """Show the current session and hand it the input"""
+        self.show_passage(self.session.text)
+        if ghost:
+            self.start_ghost(play=True)
+        else:
+            self.ghost_player = None
+        
+        # Line breaks and tabs need the multi-line input
+        typed = self.session.scorer.typed
+        self.use_input("\n" in self.current_text or "\t" in self.current_text)
+        self.input_widget.config(state="normal")
+        self.input.reset(typed)
+        # Aligned marks can run past the input when characters were skipped
+        self.highlighter.invalidate(0, max(len(typed), self.session.scorer.cursor))
+        self.input_widget.focus()
+        
+        if self.metrics:
+            self.metrics.game_started(self.session.difficulty)
+        
+        # Race passages are not the player's to resume solo
+        if self.journal_dir and not self.race:
+            path = os.path.join(self.journal_dir, f"{self.user}-{int(time.time() * 1000)}.journal")
+            self.journal = journal.SessionJournal(path, self.session, user=self.user)
+        
+        if not self.time_limit:
+            # Marathons and untimed code only end when the player stops them
+            self.start_button.config(text="⏹ Stop Game", bg=self.colors['error'], command=self.end_game)
+        else:
+            self.start_button.config(state="disabled", text="🎮 Game in Progress...", bg=self.colors['text_secondary'])
         
         # Start timer
         self.timer_running = True
         self.start_timer()
         
         # Update display
-        self.update_display()
+        self.renderer.flush_now()
+    
+    def show_passage(self, text):
+        """Replace the passage shown in the text display"""
+        self.current_text = text
+        self.text_display.config(state="normal", wrap="none" if "\n" in text else "word")
+        self.text_display.delete(1.0, "end")
+        self.text_display.insert(1.0, text)
+        self.text_display.config(state="disabled")
+        self.highlighter.reset(text)
+    
+    def use_input(self, multiline):
+        """Swap between the single-line Entry and the multi-line code input"""
+        widget = self.input_text if multiline else self.input_entry
+        if widget is self.input_widget:
+            return
+        self.input_widget.config(state="disabled")
+        self.input_widget.pack_forget()
+        widget.pack(fill="x", ipady=0 if multiline else 12)
+        self.input_widget = widget
+        self.input = self.text_input if multiline else self.entry_input
     
     def start_timer(self):
         """Start the countdown timer"""
-        def countdown():
-            while self.timer_running and self.remaining_time > 0:
-                minutes = self.remaining_time // 60
-                seconds = self.remaining_time % 60
-                self.timer_label.config(text=f"⏰ Time: {minutes}:{seconds:02d}")
-                time.sleep(1)
-                self.remaining_time -= 1
-            
-            if self.remaining_time <= 0:
-                self.end_game()
-        
-        timer_thread = threading.Thread(target=countdown, daemon=True)
-        timer_thread.start()
+        self.timer.start(self.time_limit or None, self.session.elapsed_time())
+    
+    def on_timer_tick(self, remaining):
+        """Refresh the countdown label"""
+        if math.isinf(remaining):
+            # Endless mode counts up instead
+            elapsed = int(self.timer.elapsed())
+            text = f"⏰ Time: {elapsed // 60}:{elapsed % 60:02d}"
+        else:
+            self.remaining_time = math.ceil(remaining)
+            minutes = self.remaining_time // 60
+            seconds = self.remaining_time % 60
+            text = f"⏰ Time: {minutes}:{seconds:02d}"
+        self.set_label(self.timer_label, text)
+        
+        # Live WPM decays while the player pauses, so refresh it every tick
+        if self.timer_running:
+            self.renderer.request()
+            if self.journal:
+                self.journal.sync()
+    
+    def on_time_up(self):
+        """End the game when the countdown expires"""
+        if self.timer_running:
+            self.end_game()
     
-    def on_key_press(self, event):
-        """Handle key press events"""
+    def on_input(self, timestamp, edit_start, typed_text):
+        """Score one edit to the input, timestamped when Tk applied it"""
         if not self.timer_running:
             return
-            
-        typed_text = self.input_entry.get()
-        self.current_position = len(typed_text)
+        
+        # Re-score only the characters changed by this edit
+        start, end = self.session.feed(typed_text, timestamp, edit_start)
+        self.highlighter.invalidate(start, end)
         
         # Check if game is complete
-        if self.current_position >= len(self.current_text):
+        if self.session.finished:
+            self.input.clear()
             self.end_game()
+    
+    def on_input_batch(self):
+        """Update the window and schedule a redraw after a batch of edits"""
+        if not self.timer_running:
             return
         
-        # Calculate accuracy
-        self.total_chars = self.current_position
-        self.correct_chars = 0
-        
-        for i in range(min(len(typed_text), len(self.current_text))):
-            if typed_text[i] == self.current_text[i]:
-                self.correct_chars += 1
+        if self.session.endless:
+            self.advance_window()
         
+        # Labels and highlighting are redrawn at most once per frame
+        self.renderer.request()
+    
+    def render_frame(self):
+        """Flush pending stat and highlight changes to the widgets"""
+        if self.ghost_player:
+            self.render_ghost()
+        if self.session is None:
+            return
         self.update_display()
-        self.highlight_text(typed_text)
+        self.highlight_text(self.session.scorer.typed)
+        if self.race:
+            if self.timer_running:
+                self.race.report_progress(self.session.position)
+            self.update_race_label()
+    
+    def render_ghost(self):
+        """Move the ghost cursor, asking for another frame while it plays"""
+        player = self.ghost_player
+        self.highlighter.move_marker("ghost", player.position(), len(self.current_text))
+        
+        value = round(player.elapsed(), 1)
+        if value != self.ghost_scrub_value:
+            self.ghost_scrub_value = value
+            self.ghost_scrub.set(value)
+        
+        if player.playing:
+            if player.done:
+                player.pause()
+                self.ghost_watch_button.config(text="▶ Watch")
+            else:
+                self.renderer.request()
+    
+    def set_label(self, label, text):
+        """Configure a label only when its text actually changes"""
+        if self.label_texts.get(label) != text:
+            self.label_texts[label] = text
+            label.config(text=text)
+    
+    def advance_window(self):
+        """Stream more text in and drop typed text from the front in endless mode"""
+        more = self.session.refill()
+        if more:
+            self.text_display.config(state="normal")
+            self.text_display.insert("end-1c", more)
+            self.text_display.config(state="disabled")
+        
+        trimmed = self.session.trim()
+        if trimmed:
+            self.text_display.config(state="normal")
+            self.text_display.delete("1.0", f"1.{trimmed}")
+            self.text_display.config(state="disabled")
+            with self.input.suppressed():
+                self.input_entry.delete(0, trimmed)
+            self.highlighter.shift(trimmed)
+        
+        self.current_text = self.session.text
     
     def highlight_text(self, typed_text):
         """Highlight correct/incorrect characters"""
-        self.text_display.config(state="normal")
-        
-        # Remove all tags
-        self.text_display.tag_remove("correct", 1.0, "end")
-        self.text_display.tag_remove("incorrect", 1.0, "end")
-        self.text_display.tag_remove("current", 1.0, "end")
-        
-        # Highlight typed characters
-        for i in range(len(typed_text)):
-            start_pos = f"1.{i}"
-            end_pos = f"1.{i+1}"
-            
-            if i < len(self.current_text):
-                if typed_text[i] == self.current_text[i]:
-                    self.text_display.tag_add("correct", start_pos, end_pos)
-                else:
-                    self.text_display.tag_add("incorrect", start_pos, end_pos)
-        
-        # Highlight current character
-        if len(typed_text) < len(self.current_text):
-            current_pos = f"1.{len(typed_text)}"
-            next_pos = f"1.{len(typed_text)+1}"
-            self.text_display.tag_add("current", current_pos, next_pos)
-        
-        self.text_display.config(state="disabled")
+        # Tags can be changed while the widget is disabled, and only the
+        # range touched since the last render is redrawn
+        scorer = self.session.scorer
+        self.highlighter.render(scorer.marks, scorer.cursor, len(self.current_text))
     
     def update_display(self):
         """Update WPM, accuracy, and progress displays"""
-        if self.start_time:
-            # Calculate WPM
-            elapsed_time = time.time() - self.start_time
-            if elapsed_time > 0:
-                words_typed = self.correct_chars / 5  # Average word length
-                wpm = int((words_typed / elapsed_time) * 60)
-                self.wpm_label.config(text=f"{wpm}")
-            
-            # Calculate accuracy
-            if self.total_chars > 0:
-                accuracy = int((self.correct_chars / self.total_chars) * 100)
-                self.accuracy_label.config(text=f"{accuracy}%")
-            
-            # Calculate progress
-            progress = int((self.current_position / len(self.current_text)) * 100)
-            self.progress_label.config(text=f"{progress}%")
+        if self.session and self.session.started:
+            self.set_label(self.wpm_label, f"{self.session.live_wpm()}")
+            if self.session.total_chars > 0:
+                self.set_label(self.accuracy_label, f"{self.session.accuracy()}%")
+            progress = self.session.progress()
+            self.set_label(self.progress_label, "∞" if progress is None else f"{progress}%")
     
     def end_game(self):
         """End the game and show results"""
         self.timer_running = False
-        self.end_time = time.time()
+        self.timer.cancel()
+        self.session.finish()
+        self.renderer.flush_now()
+        
+        if self.ghost_player:
+            self.ghost_player.pause()
         
         # Disable input
-        self.input_entry.config(state="disabled")
-        self.start_button.config(state="normal", text="🚀 Start Game", bg=self.colors['accent'])
+        self.input_widget.config(state="disabled")
+        self.start_button.config(state="normal", text="🚀 Start Game", bg=self.colors['accent'], command=self.start_game)
         
         # Calculate final stats
-        elapsed_time = self.end_time - self.start_time
-        words_typed = self.correct_chars / 5
-        final_wpm = int((words_typed / elapsed_time) * 60) if elapsed_time > 0 else 0
-        final_accuracy = int((self.correct_chars / self.total_chars) * 100) if self.total_chars > 0 else 0
+        result = self.session.result()
+        words = typing_engine.word_stats(self.session)
+        if self.metrics:
+            self.metrics.game_finished(self.session.difficulty, result.wpm, result.accuracy)
+        
+        if self.race:
+            self.race.finish(self.session.position, result.wpm, result.accuracy)
+            self.start_button.config(text="🏁 Join Race", command=self.ready_for_race)
+        
+        # Fold this game into the per-bigram stats used by adaptive practice
+        self.typing_stats.add_session(self.session)
+        try:
+            self.typing_stats.save()
+        except OSError:
+            pass
+        if self.adaptive_var.get():
+            # The weak bigrams moved, so queued adaptive passages are stale
+            self.refresh_passages()
+        
+        if self.record_dir and not self.session.endless:
+            self.save_recording()
+        
+        # Saved on the store's thread so the dialog shows up immediately
+        if self.store:
+            self.store.record(
+                self.user, self.session.difficulty, self.time_limit,
+                result.wpm, result.accuracy, result.elapsed_time, words=words,
+                rhythm=typing_engine.rhythm(self.session)
+            )
+        
+        # The game is saved, so it no longer needs recovering
+        if self.journal:
+            self.journal.close(delete=True)
+            self.journal = None
+        
+        if self.profiler.enabled and self.profile_dump_dir:
+            try:
+                self.dump_profile(result)
+            except OSError:
+                pass
         
         # Show beautiful results dialog
-        self.show_results_dialog(final_wpm, final_accuracy, elapsed_time)
+        self.show_results_dialog(result.wpm, result.accuracy, result.elapsed_time, words)
     
-    def show_results_dialog(self, wpm, accuracy, elapsed_time):
-        """Show a beautiful results dialog"""
+    def build_results_dialog(self):
+        """Build the results dialog once; later games only repopulate it"""
         # Create custom dialog
         dialog = tk.Toplevel(self.root)
+        dialog.withdraw()
         dialog.title("🏆 Game Results")
-        dialog.geometry("450x500")
+        dialog.geometry("450x760")
         dialog.configure(bg=self.colors['bg_primary'])
         dialog.resizable(False, False)
-        
-        # Center the dialog
         dialog.transient(self.root)
-        dialog.grab_set()
+        dialog.protocol("WM_DELETE_WINDOW", self.hide_results_dialog)
+        self.results_dialog = dialog
         
         # Header
         header_frame = tk.Frame(dialog, bg=self.colors['accent'], height=60)
@@ -565,7 +1540,7 @@ class TypingSpeedGame:
         tk.Label(
             header_frame,
             text="🏆 Game Complete!",
-            font=font.Font(family="Arial", size=20, weight="bold"),
+            font=self.fonts.get("display", 20, "bold"),
             bg=self.colors['accent'],
             fg="white"
         ).pack(expand=True)
@@ -575,38 +1550,32 @@ class TypingSpeedGame:
         content_frame.pack(fill="both", expand=True, padx=30, pady=30)
         
         # Performance rating
-        rating = self.get_performance_rating(wpm, accuracy)
-        rating_parts = rating.split(' ', 1)
-        emoji = rating_parts[0] if len(rating_parts) > 1 else "📚"
-        text = rating_parts[1] if len(rating_parts) > 1 else rating
-        
-        tk.Label(
+        self.results_emoji = tk.Label(
             content_frame,
-            text=emoji,
-            font=font.Font(size=40),
+            font=self.fonts.get("text", 40),
             bg=self.colors['bg_primary'],
             fg=self.colors['accent']
-        ).pack(pady=(0, 10))
+        )
+        self.results_emoji.pack(pady=(0, 10))
         
-        tk.Label(
+        self.results_rating = tk.Label(
             content_frame,
-            text=text,
-            font=font.Font(family="Arial", size=14, weight="bold"),
+            font=self.stat_font,
             bg=self.colors['bg_primary'],
             fg=self.colors['text_primary'],
             wraplength=350,
             justify="center"
-        ).pack(pady=(0, 30))
+        )
+        self.results_rating.pack(pady=(0, 30))
         
         # Stats cards
-        stats = [
-            ("⚡", "Words Per Minute", f"{wpm}", self.colors['info']),
-            ("🎯", "Accuracy", f"{accuracy}%", self.colors['success']),
-            ("⏱️", "Time Taken", f"{elapsed_time:.1f}s", self.colors['warning']),
-            ("📝", "Difficulty", self.difficulty_var.get(), self.colors['accent'])
-        ]
-        
-        for icon, label, value, color in stats:
+        self.results_values = {}
+        for key, icon, label, color in (
+            ("wpm", "⚡", "Words Per Minute", self.colors['info']),
+            ("accuracy", "🎯", "Accuracy", self.colors['success']),
+            ("time", "⏱️", "Time Taken", self.colors['warning']),
+            ("difficulty", "📝", "Difficulty", self.colors['accent'])
+        ):
             card = tk.Frame(content_frame, bg=self.colors['bg_secondary'])
             card.pack(fill="x", pady=5)
             
@@ -624,13 +1593,38 @@ class TypingSpeedGame:
                 fg=self.colors['text_secondary']
             ).pack(side="left")
             
-            tk.Label(
+            value_label = tk.Label(
                 card_content,
-                text=value,
-                font=font.Font(family="Arial", size=14, weight="bold"),
+                font=self.stat_font,
                 bg=self.colors['bg_secondary'],
                 fg=color
-            ).pack(side="right")
+            )
+            value_label.pack(side="right")
+            self.results_values[key] = value_label
+        
+        # Word breakdown: this game's slowest words and the player's usual ones
+        self.results_words = {}
+        for key, title in (("slowest", "🐢 Slowest Words"), ("hot_spots", "🔥 Hot Spots")):
+            card = tk.Frame(content_frame, bg=self.colors['bg_secondary'])
+            card.pack(fill="x", pady=5)
+            tk.Frame(card, bg=self.colors['error'], height=2).pack(fill="x")
+            title_label = tk.Label(
+                card,
+                text=title,
+                font=self.body_font,
+                bg=self.colors['bg_secondary'],
+                fg=self.colors['text_secondary']
+            )
+            title_label.pack(anchor="w", padx=15, pady=(8, 0))
+            body = tk.Label(
+                card,
+                font=self.mono_font,
+                bg=self.colors['bg_secondary'],
+                fg=self.colors['text_primary'],
+                justify="left"
+            )
+            body.pack(anchor="w", padx=15, pady=(0, 8))
+            self.results_words[key] = (title_label, body)
         
         # Close button
         tk.Button(
@@ -639,32 +1633,446 @@ class TypingSpeedGame:
             font=self.heading_font,
             bg=self.colors['accent'],
             fg="white",
-            command=dialog.destroy,
+            command=self.hide_results_dialog,
             padx=30,
             pady=10,
             border=0,
             cursor="hand2",
             activebackground=self.colors['accent_hover'],
             relief="flat"
-        ).pack(pady=(30, 0))
+        ).pack(pady=(20, 0))
+    
+    def show_results_dialog(self, wpm, accuracy, elapsed_time, words=()):
+        """Show a beautiful results dialog"""
+        if self.results_dialog is None:
+            self.build_results_dialog()
+        
+        rating = self.get_performance_rating(wpm, accuracy)
+        rating_parts = rating.split(' ', 1)
+        self.results_emoji.config(text=rating_parts[0] if len(rating_parts) > 1 else "📚")
+        self.results_rating.config(text=rating_parts[1] if len(rating_parts) > 1 else rating)
+        self.results_values["wpm"].config(text=f"{wpm}")
+        self.results_values["accuracy"].config(text=f"{accuracy}%")
+        self.results_values["time"].config(text=f"{elapsed_time:.1f}s")
+        self.results_values["difficulty"].config(text=self.session.difficulty)
+        
+        slowest = typing_engine.slowest_words(words, 4)
+        self.results_words["slowest"][1].config(text="\n".join(
+            f"{w.word[:16]:<16} {w.time:>5.1f}s  pause {w.hesitation:.1f}s  {w.errors} err {w.corrections} fix"
+            for w in slowest
+        ) or ("Not tracked with forgiving scoring" if self.session.scoring != "positional" else "No words typed"))
+        self.show_hot_spots(self.session.difficulty)
+        
+        self.results_dialog.deiconify()
+        self.results_dialog.lift()
+        self.results_dialog.grab_set()
+    
+    def show_hot_spots(self, difficulty):
+        """Fill the results dialog's hot spots from the history"""
+        title, body = self.results_words["hot_spots"]
+        title.config(text=f"🔥 {difficulty} Hot Spots")
+        if not self.store:
+            body.config(text="History is off")
+            return
+        
+        def callback(rows):
+            if isinstance(rows, Exception):
+                text = f"Unavailable: {rows}"
+            else:
+                text = "\n".join(format_hot_spot(row) for row in rows) or "Not enough games yet"
+            body.config(text=text)
+        
+        body.config(text="Loading...")
+        self.store.query_async(callback, "hot_spots", self.user, difficulty, 4)
+    
+    def hide_results_dialog(self):
+        self.results_dialog.grab_release()
+        self.results_dialog.withdraw()
+    
+    def offer_resume(self):
+        """Resume or score games a previous run left unfinished"""
+        for path in journal.find_journals(self.journal_dir):
+            try:
+                state = journal.read_journal(path)
+            except (OSError, ValueError, KeyError):
+                state = None
+            if state and (state.typed or state.offset):
+                answer = messagebox.askyesnocancel(
+                    "Unfinished Game",
+                    f"A {state.difficulty} game was interrupted after {int(state.elapsed)}s.\n\n"
+                    "Yes resumes it, No scores it as it stands."
+                )
+                if answer is None:
+                    return
+                source = typing_engine.endless_text(state.difficulty, corpus=self.corpus) if state.endless else None
+                session = journal.restore_session(state, text_source=source)
+                os.remove(path)
+                # resume_game journals it afresh under the new clock
+                self.resume_game(session)
+                # An expired game has already been ended by its timer
+                if not answer and self.timer_running:
+                    self.end_game()
+                return
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    def save_recording(self):
+        """Write the keystroke recording so the game can be re-graded offline"""
+        recording = typing_engine.session_to_recording(self.session, user=self.user, created_at=time.time())
+        path = os.path.join(self.record_dir, f"{self.user}-{int(time.time() * 1000)}.json")
+        try:
+            os.makedirs(self.record_dir, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(recording, f)
+        except OSError:
+            pass
+    
+    def ghost_speed(self):
+        return float(self.ghost_speed_var.get().rstrip("x"))
+    
+    def load_ghost(self):
+        """Pick a saved recording to race against or watch"""
+        path = filedialog.askopenfilename(
+            title="Choose a recording",
+            initialdir=self.record_dir or None,
+            filetypes=[("Recordings", "*.json"), ("All files", "*")]
+        )
+        if not path:
+            return
+        try:
+            with open(path, encoding="utf-8") as f:
+                track = GhostTrack.from_recording(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            messagebox.showerror("Race Ghost", f"Could not load the recording:\n{exc}")
+            return
+        
+        self.ghost_track = track
+        self.ghost_scrub.config(to=max(track.duration, 0.1))
+        self.set_label(self.ghost_label, f"👻 {os.path.basename(path)}")
+        self.ghost_frame.pack(fill="x", pady=(15, 0))
+        if not self.timer_running:
+            self.watching_ghost = True
+            self.session = None
+            self.show_passage(track.text)
+            self.start_ghost(play=False)
+    
+    def start_ghost(self, play):
+        """Rewind the ghost to the start of its recording"""
+        self.ghost_player = GhostPlayer(self.ghost_track, self.ghost_speed())
+        self.ghost_scrub_value = 0.0
+        self.ghost_scrub.set(0)
+        if play:
+            self.ghost_player.play()
+            self.watching_ghost = False
+        self.ghost_watch_button.config(text="⏸ Pause" if play else "▶ Watch")
+        self.renderer.request()
+    
+    def watch_ghost(self):
+        """Play or pause the ghost on its own, without a game running"""
+        if self.timer_running or self.ghost_track is None:
+            return
+        if not self.watching_ghost:
+            self.watching_ghost = True
+            self.session = None
+            self.show_passage(self.ghost_track.text)
+            self.start_ghost(play=False)
+        
+        player = self.ghost_player
+        if player.playing:
+            player.pause()
+            self.ghost_watch_button.config(text="▶ Watch")
+        else:
+            if player.done:
+                player.seek(0)
+            player.play()
+            self.ghost_watch_button.config(text="⏸ Pause")
+        self.renderer.request()
+    
+    def on_ghost_scrub(self, value):
+        """Seek the ghost when the scrub bar is dragged"""
+        value = float(value)
+        # render_ghost moving the bar also lands here
+        if self.ghost_player is None or abs(value - self.ghost_scrub_value) < 0.05:
+            return
+        self.ghost_scrub_value = value
+        self.ghost_player.seek(value)
+        self.renderer.request()
+    
+    def on_ghost_speed(self, event=None):
+        if self.ghost_player:
+            self.ghost_player.set_speed(self.ghost_speed())
+    
+    def clear_ghost(self):
+        """Stop racing the ghost and remove its cursor"""
+        self.ghost_track = None
+        self.ghost_player = None
+        self.watching_ghost = False
+        self.text_display.tag_remove("ghost", "1.0", "end")
+        self.highlighter.markers.pop("ghost", None)
+        self.ghost_frame.pack_forget()
+    
+    def ready_for_race(self):
+        """Tell the race server we want to be in the next race"""
+        self.race.send({"type": "ready"})
+        self.start_button.config(state="disabled", text="⏳ Waiting for race...", bg=self.colors['text_secondary'])
+    
+    def poll_race(self):
+        """Handle messages from the race connection on the Tk thread"""
+        while True:
+            try:
+                message = self.race.inbox.get_nowait()
+            except queue.Empty:
+                break
+            kind = message.get("type")
+            if kind == "joined":
+                self.race_id = message["id"]
+                self.set_label(self.race_label, f"🏁 Joined room {message['room']}")
+            elif kind == "queued":
+                self.set_label(self.race_label, "🏁 Race in progress, you're in the next one")
+            elif kind == "countdown":
+                self.set_label(self.race_label, f"🏁 Next race starts in {message['seconds']:.0f}s")
+            elif kind == "start":
+                self.race_names = {racer_id: name for racer_id, name in message["racers"]}
+                self.race_positions = {racer_id: 0 for racer_id in self.race_names}
+                self.start_game(message["text"], message["time_limit"])
+            elif kind == "state":
+                for racer_id, (position, finished) in message["positions"].items():
+                    self.race_positions[int(racer_id)] = position
+                self.renderer.request()
+            elif kind == "left":
+                self.race_positions.pop(message["id"], None)
+                self.renderer.request()
+            elif kind == "results":
+                standings = [f"{i + 1}. {name} {wpm} WPM" for i, (_, name, wpm, _, _) in enumerate(message["standings"][:5])]
+                self.set_label(self.race_label, "🏆 " + "  ·  ".join(standings))
+            elif kind in ("error", "disconnected"):
+                self.set_label(self.race_label, f"🏁 Race server unavailable {message.get('message', '')}".rstrip())
+                self.race = None
+                # A race game in progress finishes as a solo game; end_game restores Start
+                if not self.timer_running:
+                    self.start_button.config(state="normal", text="🚀 Start Game", bg=self.colors['accent'], command=self.start_game)
+                return
+        self.root.after(50, self.poll_race)
+    
+    def update_race_label(self):
+        """Show the leading opponents' progress"""
+        if not self.timer_running or not self.session.text:
+            return
+        length = len(self.session.text)
+        leaders = sorted(
+            ((position, racer_id) for racer_id, position in self.race_positions.items() if racer_id != self.race_id),
+            reverse=True
+        )[:4]
+        parts = [f"{self.race_names.get(racer_id, '?')} {position * 100 // length}%" for position, racer_id in leaders]
+        self.set_label(self.race_label, "🏁 " + ("  ·  ".join(parts) or "Racing solo"))
+    
+    def poll_store(self):
+        """Deliver finished history queries on the Tk thread"""
+        self.store.dispatch_results()
+        self.root.after(100, self.poll_store)
+    
+    def show_history_dialog(self):
+        """Show the leaderboard and the player's progress"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("🏆 History")
+        dialog.geometry("520x560")
+        dialog.configure(bg=self.colors['bg_primary'])
+        dialog.transient(self.root)
+        
+        difficulty = self.difficulty_var.get()
+        sections = {}
+        for key, title in (
+            ("leaderboard", f"🏆 {difficulty} Leaderboard"),
+            ("summary", f"📈 {self.user}'s Progress"),
+            ("recent", "🕒 Recent Games"),
+            ("hot_spots", f"🔥 {difficulty} Hot Spots"),
+        ):
+            card = tk.Frame(dialog, bg=self.colors['bg_secondary'])
+            card.pack(fill="x", padx=20, pady=(15, 0))
+            tk.Frame(card, bg=self.colors['accent'], height=2).pack(fill="x")
+            tk.Label(
+                card,
+                text=title,
+                font=self.heading_font,
+                bg=self.colors['bg_secondary'],
+                fg=self.colors['text_primary']
+            ).pack(anchor="w", padx=15, pady=(10, 5))
+            body = tk.Label(
+                card,
+                text="Loading...",
+                font=self.mono_font,
+                bg=self.colors['bg_secondary'],
+                fg=self.colors['text_secondary'],
+                justify="left"
+            )
+            body.pack(anchor="w", padx=15, pady=(0, 10))
+            sections[key] = body
+        
+        def fill(key, format_row):
+            def callback(rows):
+                if not sections[key].winfo_exists():
+                    return
+                if isinstance(rows, Exception):
+                    text = f"Unavailable: {rows}"
+                else:
+                    text = "\n".join(format_row(i, row) for i, row in enumerate(rows)) or "No games yet"
+                sections[key].config(text=text)
+            return callback
+        
+        self.store.query_async(
+            fill("leaderboard", lambda i, r: f"{i + 1:>2}. {r[0]:<16} {r[1]:>4} WPM  ({r[2]} games)"),
+            "leaderboard", difficulty, 5
+        )
+        self.store.query_async(
+            fill("summary", lambda i, r: f"{r[0]:<7} {r[1]:>4} games  best {r[2]:>3}  avg {r[3]:.0f} WPM {r[4]:.0f}%"),
+            "user_summary", self.user
+        )
+        self.store.query_async(
+            fill("recent", lambda i, r: f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(r.created_at))}"
+                                        f"  {r.difficulty:<7} {r.wpm:>3} WPM {r.accuracy:>3}%"),
+            "sessions", self.user, None, None, None, 8
+        )
+        self.store.query_async(
+            fill("hot_spots", lambda i, r: format_hot_spot(r)),
+            "hot_spots", self.user, difficulty, 5
+        )
+    
+    def show_progress_dialog(self):
+        """Show the player's trends, typing rhythm and standing"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("📈 Progress")
+        dialog.geometry("560x600")
+        dialog.configure(bg=self.colors['bg_primary'])
+        dialog.transient(self.root)
+        
+        sections = {}
+        for key, title in (
+            ("trend", f"📈 {self.user}'s Weekly Trend"),
+            ("rhythm", "🎵 Rhythm"),
+            ("standing", "🏅 Standing"),
+        ):
+            card = tk.Frame(dialog, bg=self.colors['bg_secondary'])
+            card.pack(fill="x", padx=20, pady=(15, 0))
+            tk.Frame(card, bg=self.colors['info'], height=2).pack(fill="x")
+            tk.Label(
+                card,
+                text=title,
+                font=self.heading_font,
+                bg=self.colors['bg_secondary'],
+                fg=self.colors['text_primary']
+            ).pack(anchor="w", padx=15, pady=(10, 5))
+            body = tk.Label(
+                card,
+                text="Loading...",
+                font=self.mono_font,
+                bg=self.colors['bg_secondary'],
+                fg=self.colors['text_secondary'],
+                justify="left"
+            )
+            body.pack(anchor="w", padx=15, pady=(0, 10))
+            sections[key] = body
+        
+        def callback(report):
+            if not dialog.winfo_exists():
+                return
+            if isinstance(report, Exception):
+                for body in sections.values():
+                    body.config(text=f"Unavailable: {report}")
+                return
+            if report is None:
+                for body in sections.values():
+                    body.config(text="No games yet")
+                return
+            
+            weeks = report.weeks[-10:]
+            fastest = max(week.wpm for week in weeks) or 1
+            lines = [
+                f"{time.strftime('%Y-%m-%d', time.localtime(week.week))} {week.games:>3} games"
+                f" {week.wpm:>4.0f} WPM {week.accuracy:>3.0f}%  {'█' * round(week.wpm / fastest * 16)}"
+                for week in weeks
+            ]
+            lines.append(f"{report.games} games, {report.wpm_per_week:+.1f} WPM per week")
+            sections["trend"].config(text="\n".join(lines))
+            
+            if report.interval_sd is None:
+                sections["rhythm"].config(text="Play a game to measure your rhythm")
+            else:
+                sections["rhythm"].config(text="\n".join((
+                    f"Keystroke spacing  ±{report.interval_sd * 1000:.0f} ms  (variation {report.interval_cv:.0%})",
+                    f"Bursts             {report.bursts_per_minute:.1f} per minute",
+                    f"Pauses over {typing_engine.PAUSE_INTERVAL:.0f}s   {report.pauses_per_minute:.1f} per minute",
+                )))
+            
+            sections["standing"].config(text="\n".join(
+                f"{rank.difficulty:<7} {rank.wpm:>4.0f} WPM avg  ahead of {rank.percentile:>3.0f}%"
+                f" of {rank.players} players"
+                for rank in report.ranks
+            ))
+        
+        self.store.query_async(callback, "progress", self.user)
     
     def get_performance_rating(self, wpm, accuracy):
         """Get performance rating based on WPM and accuracy"""
-        if wpm >= 60 and accuracy >= 95:
-            return "🏆 Excellent! Professional level typing!"
-        elif wpm >= 40 and accuracy >= 90:
-            return "🥇 Great! Above average typing skills!"
-        elif wpm >= 25 and accuracy >= 80:
-            return "🥈 Good! Average typing skills!"
-        elif wpm >= 15 and accuracy >= 70:
-            return "🥉 Fair! Keep practicing!"
-        else:
-            return "📚 Beginner! Practice more to improve!"
+        return typing_engine.get_performance_rating(wpm, accuracy)
 
-def main():
-    root = tk.Tk()
-    game = TypingSpeedGame(root)
-    root.mainloop()
+def format_hot_spot(row):
+    word, attempts, average_time, average_hesitation, error_rate = row
+    return f"{word[:16]:<16} {average_time:>5.1f}s  pause {average_hesitation:.1f}s  {error_rate:.0%} err  ×{attempts}"
+
+
+def main(argv=None):
+    startup = PhaseTimer(STARTED)
+    startup.mark("imports")
+    parser = argparse.ArgumentParser(description="Typing Speed Master")
+    parser.add_argument("--corpus", help="word file (one entry per line, optional tab + frequency)")
+    parser.add_argument("--history", default=history.DEFAULT_PATH, help="results database")
+    parser.add_argument("--no-history", action="store_true", help="do not save results")
+    parser.add_argument("--user", help="player name for saved results")
+    parser.add_argument("--fps", type=int, default=60, help="maximum UI refreshes per second")
+    parser.add_argument("--profile", action="store_true", help="record per-keystroke latency from launch")
+    parser.add_argument("--profile-dump", metavar="DIR", help="write latency histograms here after each game")
+    parser.add_argument("--race", metavar="HOST:PORT", help="join races on a race_server.py server")
+    parser.add_argument("--room", default="lobby", help="race room to join")
+    parser.add_argument("--record", metavar="DIR", help="save keystroke recordings for grading.py")
+    parser.add_argument("--code", metavar="FILE", help="type snippets of this source file")
+    parser.add_argument("--journal", default=journal.DEFAULT_DIR, metavar="DIR", help="where games in progress are journaled")
+    parser.add_argument("--no-journal", action="store_true", help="do not journal games in progress")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT", help="serve Prometheus metrics on localhost:PORT")
+    args = parser.parse_args(argv)
+    
+    with startup.phase("corpus"):
+        corpus = Corpus.load(args.corpus) if args.corpus else None
+    store = None if args.no_history else ResultsStore(args.history)
+    race = None
+    if args.race:
+        host, _, port = args.race.rpartition(":")
+        race = RaceClient(host or "127.0.0.1", int(port), args.room, args.user or getpass.getuser())
+    
+    with startup.phase("tk"):
+        root = tk.Tk()
+    journal_dir = None if args.no_journal else args.journal
+    metrics = exporter = None
+    if args.metrics_port is not None:
+        metrics = GameMetrics()
+        exporter = MetricsExporter(metrics, args.metrics_port)
+    game = TypingSpeedGame(root, corpus, store, args.user, args.fps, args.profile, args.profile_dump, race,
+                           args.record, args.code, journal_dir, startup, metrics)
+    try:
+        root.mainloop()
+    finally:
+        if game.journal:
+            # Closing mid-game leaves the journal to resume from next time
+            game.journal.sync()
+            game.journal.close()
+        game.passages.close()
+        if store:
+            store.close()
+        if race:
+            race.close()
+        if exporter:
+            exporter.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
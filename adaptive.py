@@ -0,0 +1,206 @@
+"""Adaptive practice text weighted toward the player's weak bigrams
+
+TypingStats accumulates per-character and per-bigram attempts, errors and
+keystroke latency. Each finished session is folded in once, so the stats
+never need to be recomputed from history. BigramIndex maps every bigram to
+the corpus words containing it, so once the weakest bigrams are known a
+practice word costs one weighted pick and one random index.
+"""
+import json
+import os
+import random
+from array import array
+from bisect import bisect_right
+
+import typing_engine
+from typing_engine import EDIT_INSERT
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".local", "share", "typing-speed-game", "adaptive.json")
+
+# Gaps longer than this are pauses, not keystroke latency
+MAX_INTERVAL = 2.0
+
+
+class KeyStats:
+    __slots__ = ("attempts", "errors", "latency", "timed")
+
+    def __init__(self, attempts=0, errors=0, latency=0.0, timed=0):
+        self.attempts = attempts
+        self.errors = errors
+        self.latency = latency  # total seconds over timed keystrokes
+        self.timed = timed
+
+    def error_rate(self):
+        # Smoothed so a single attempt is not a 0% or 100% error rate
+        return (self.errors + 1) / (self.attempts + 2)
+
+    def mean_latency(self):
+        return self.latency / self.timed if self.timed else 0.0
+
+
+class TypingStats:
+    """Per-character and per-bigram error and latency totals"""
+
+    def __init__(self):
+        self.chars = {}
+        self.bigrams = {}
+
+    def _entry(self, table, key):
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = KeyStats()
+        return stats
+
+    def add_session(self, session):
+        """Fold one session's keystroke log into the totals
+
+        Positions are looked up in the session's current text window, so
+        for endless sessions only the part still in the window counts.
+        Aligned sessions are skipped: their log holds input positions,
+        which stop matching the passage after a skipped or doubled key.
+        """
+        if session.scoring != "positional":
+            return
+        log = session.log
+        text = session.text
+        offset = session.offset
+        previous_position = None
+        previous_time = None
+        for i in range(len(log)):
+            if log.kinds[i] != EDIT_INSERT:
+                previous_position = None
+                continue
+            position = log.positions[i] - offset
+            timestamp = log.timestamps[i]
+            if not 0 <= position < len(text):
+                previous_position = None
+                continue
+            expected = text[position]
+            correct = log.correct[i]
+
+            char_stats = self._entry(self.chars, expected)
+            char_stats.attempts += 1
+            char_stats.errors += 0 if correct else 1
+
+            if position > 0:
+                bigram_stats = self._entry(self.bigrams, text[position - 1:position + 1])
+                bigram_stats.attempts += 1
+                bigram_stats.errors += 0 if correct else 1
+                if previous_position == position - 1:
+                    interval = timestamp - previous_time
+                    if 0 < interval <= MAX_INTERVAL:
+                        char_stats.latency += interval
+                        char_stats.timed += 1
+                        bigram_stats.latency += interval
+                        bigram_stats.timed += 1
+            previous_position = position
+            previous_time = timestamp
+
+    def weakest_bigrams(self, count=20, min_attempts=3, latency_weight=0.5):
+        """[(bigram, weakness)] for the bigrams most worth practising"""
+        timed = [s for s in self.bigrams.values() if s.timed]
+        overall = sum(s.latency for s in timed) / max(1, sum(s.timed for s in timed))
+        scored = []
+        for bigram, stats in self.bigrams.items():
+            if stats.attempts < min_attempts or not bigram.strip() or " " in bigram:
+                continue
+            weakness = stats.error_rate()
+            if overall and stats.timed:
+                weakness += latency_weight * stats.mean_latency() / overall
+            scored.append((weakness, bigram))
+        scored.sort(reverse=True)
+        return [(bigram, weakness) for weakness, bigram in scored[:count]]
+
+    def to_dict(self):
+        def dump(table):
+            return {key: [s.attempts, s.errors, s.latency, s.timed] for key, s in table.items()}
+        return {"chars": dump(self.chars), "bigrams": dump(self.bigrams)}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for table, key in ((stats.chars, "chars"), (stats.bigrams, "bigrams")):
+            for name, values in data.get(key, {}).items():
+                table[name] = KeyStats(*values)
+        return stats
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls.from_dict(json.load(f))
+        except (OSError, ValueError):
+            return cls()
+
+    def save(self, path=DEFAULT_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+
+class BigramIndex:
+    """Inverted index from bigram to the entries of one corpus tier containing it"""
+
+    def __init__(self, corpus, difficulty):
+        self.corpus = corpus
+        self.tier = corpus.tiers[difficulty]
+        self.words = {}
+        for index in range(len(self.tier)):
+            entry = corpus.entry(self.tier, index)
+            for bigram in {entry[i:i + 2] for i in range(len(entry) - 1)}:
+                ids = self.words.get(bigram)
+                if ids is None:
+                    ids = self.words[bigram] = array("I")
+                ids.append(index)
+
+    def sample(self, bigram, rng=random):
+        ids = self.words.get(bigram)
+        if not ids:
+            return None
+        return self.corpus.entry(self.tier, ids[rng.randrange(len(ids))])
+
+
+class AdaptiveGenerator:
+    """Builds passages where a share of the words target weak bigrams"""
+
+    def __init__(self, corpus, stats, focus=0.6):
+        self.corpus = corpus
+        self.stats = stats
+        self.focus = focus
+        self.indexes = {}
+
+    def index(self, difficulty):
+        """Bigram index for a tier, built on first use"""
+        if difficulty not in self.indexes:
+            self.indexes[difficulty] = BigramIndex(self.corpus, difficulty)
+        return self.indexes[difficulty]
+
+    def generate(self, difficulty, rng=random, weak=None):
+        """A passage for difficulty; weak overrides the stats' weakest_bigrams()"""
+        if weak is None:
+            weak = self.stats.weakest_bigrams()
+        index = self.index(difficulty)
+        weak = [(bigram, weight) for bigram, weight in weak if bigram in index.words]
+        if not weak:
+            return typing_engine.generate_text(difficulty, rng, self.corpus)
+
+        bigrams = [bigram for bigram, _ in weak]
+        cum_weights = []
+        total = 0.0
+        for _, weight in weak:
+            total += weight
+            cum_weights.append(total)
+
+        num_words = rng.randint(50, 80)
+        targeted = sum(1 for _ in range(num_words) if rng.random() < self.focus)
+        words = [
+            index.sample(bigrams[bisect_right(cum_weights, rng.random() * total)], rng)
+            for _ in range(targeted)
+        ]
+        words += self.corpus.sample(difficulty, num_words - targeted, rng)
+        rng.shuffle(words)
+        return " ".join(words)
@@ -0,0 +1,212 @@
+"""Progress analytics over the session history
+
+The history is loaded once into parallel typed arrays (one per column)
+and then only new sessions are appended, so a refresh reads just the rows
+added since the last one. A player's report is a single pass over their
+rows: weekly WPM and accuracy, the WPM trend, keystroke rhythm, bursts
+and pauses. Reports are cached per player and dropped when that player
+finishes another game. Percentile ranks compare running per-player
+averages and are re-sorted only after new sessions arrive.
+"""
+import math
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+WEEK = 7 * 86400
+
+# Columns read from the sessions table, in order
+COLUMNS = (
+    "id", "user", "difficulty", "wpm", "accuracy", "elapsed_time", "created_at",
+    "keystrokes", "interval_mean", "interval_var", "bursts", "pauses",
+)
+
+WeekTrend = namedtuple("WeekTrend", "week games wpm accuracy")
+Rank = namedtuple("Rank", "difficulty percentile wpm players")
+ProgressReport = namedtuple(
+    "ProgressReport",
+    "user games weeks wpm_per_week interval_sd interval_cv bursts_per_minute pauses_per_minute ranks",
+)
+
+
+class SessionColumns:
+    """Finished sessions as parallel arrays, with each player's row numbers
+
+    Users and difficulties are stored as small integer codes. Sessions
+    saved before keystroke rhythm was recorded have zero keystrokes.
+    """
+
+    def __init__(self):
+        self.last_id = 0
+        self.users = []
+        self.user_codes = {}
+        self.difficulties = []
+        self.difficulty_codes = {}
+        self.user = array("I")
+        self.difficulty = array("I")
+        self.wpm = array("d")
+        self.accuracy = array("d")
+        self.elapsed_time = array("d")
+        self.created_at = array("d")
+        self.keystrokes = array("I")
+        self.interval_mean = array("d")
+        self.interval_var = array("d")
+        self.bursts = array("I")
+        self.pauses = array("I")
+        self.rows_by_user = {}
+
+    def __len__(self):
+        return len(self.wpm)
+
+    def _code(self, names, codes, name):
+        code = codes.get(name)
+        if code is None:
+            code = codes[name] = len(names)
+            names.append(name)
+        return code
+
+    def append(self, rows):
+        """Add rows shaped like COLUMNS, oldest first; returns the codes of users who got new rows"""
+        touched = set()
+        for (session_id, user, difficulty, wpm, accuracy, elapsed_time, created_at,
+             keystrokes, interval_mean, interval_var, bursts, pauses) in rows:
+            user_code = self._code(self.users, self.user_codes, user)
+            rows_for_user = self.rows_by_user.get(user_code)
+            if rows_for_user is None:
+                rows_for_user = self.rows_by_user[user_code] = array("I")
+            rows_for_user.append(len(self.wpm))
+            touched.add(user_code)
+
+            self.user.append(user_code)
+            self.difficulty.append(self._code(self.difficulties, self.difficulty_codes, difficulty))
+            self.wpm.append(wpm)
+            self.accuracy.append(accuracy)
+            self.elapsed_time.append(elapsed_time)
+            self.created_at.append(created_at)
+            self.keystrokes.append(keystrokes or 0)
+            self.interval_mean.append(interval_mean or 0.0)
+            self.interval_var.append(interval_var or 0.0)
+            self.bursts.append(bursts or 0)
+            self.pauses.append(pauses or 0)
+            self.last_id = max(self.last_id, session_id)
+        return touched
+
+
+class ProgressAnalytics:
+    """Per-player progress reports over SessionColumns, cached until they go stale"""
+
+    def __init__(self):
+        self.columns = SessionColumns()
+        self.reports = {}
+        # Running (games, total WPM) per (difficulty, user) code for ranking
+        self.averages = {}
+        self.rankings = None
+
+    def update(self, rows):
+        """Append new session rows and invalidate what they change"""
+        columns = self.columns
+        first = len(columns)
+        touched = columns.append(rows)
+        if not touched:
+            return
+        for user_code in touched:
+            self.reports.pop(user_code, None)
+        averages = self.averages
+        for i in range(first, len(columns)):
+            key = (columns.difficulty[i], columns.user[i])
+            games, total = averages.get(key, (0, 0.0))
+            averages[key] = (games + 1, total + columns.wpm[i])
+        self.rankings = None
+
+    def report(self, user):
+        """A ProgressReport for user, or None if they have no games"""
+        user_code = self.columns.user_codes.get(user)
+        if user_code is None:
+            return None
+        report = self.reports.get(user_code)
+        if report is None:
+            report = self.reports[user_code] = self._build(user, user_code)
+        return report._replace(ranks=self._ranks(user_code))
+
+    def _build(self, user, user_code):
+        columns = self.columns
+        rows = columns.rows_by_user[user_code]
+        created_at = columns.created_at
+        wpm = columns.wpm
+        accuracy = columns.accuracy
+        keystrokes = columns.keystrokes
+        interval_mean = columns.interval_mean
+        interval_var = columns.interval_var
+
+        weeks = {}
+        origin = created_at[rows[0]]
+        n = sx = sy = sxx = sxy = 0.0
+        timed = 0
+        total_var = total_cv = 0.0
+        bursts = pauses = 0
+        minutes = 0.0
+        for i in rows:
+            when = created_at[i]
+            speed = wpm[i]
+            week = int(when // WEEK)
+            totals = weeks.get(week)
+            if totals is None:
+                totals = weeks[week] = [0, 0.0, 0.0]
+            totals[0] += 1
+            totals[1] += speed
+            totals[2] += accuracy[i]
+
+            # Least-squares fit of WPM against weeks since the first game
+            x = (when - origin) / WEEK
+            n += 1
+            sx += x
+            sy += speed
+            sxx += x * x
+            sxy += x * speed
+
+            if keystrokes[i] > 1 and interval_mean[i] > 0:
+                timed += 1
+                total_var += interval_var[i]
+                total_cv += math.sqrt(interval_var[i]) / interval_mean[i]
+                bursts += columns.bursts[i]
+                pauses += columns.pauses[i]
+                minutes += columns.elapsed_time[i] / 60
+
+        spread = n * sxx - sx * sx
+        return ProgressReport(
+            user=user,
+            games=len(rows),
+            weeks=[
+                WeekTrend(week * WEEK, games, total_wpm / games, total_accuracy / games)
+                for week, (games, total_wpm, total_accuracy) in sorted(weeks.items())
+            ],
+            wpm_per_week=(n * sxy - sx * sy) / spread if spread > 1e-9 else 0.0,
+            interval_sd=math.sqrt(total_var / timed) if timed else None,
+            interval_cv=total_cv / timed if timed else None,
+            bursts_per_minute=bursts / minutes if minutes else None,
+            pauses_per_minute=pauses / minutes if minutes else None,
+            ranks=[],
+        )
+
+    def _ranks(self, user_code):
+        """[Rank] for every difficulty the player has games in"""
+        if self.rankings is None:
+            # Sorted per-player average WPM for each difficulty
+            rankings = {}
+            for (difficulty, _), (games, total) in self.averages.items():
+                rankings.setdefault(difficulty, []).append(total / games)
+            for averages in rankings.values():
+                averages.sort()
+            self.rankings = rankings
+
+        ranks = []
+        for difficulty, averages in sorted(self.rankings.items(), key=lambda item: self.columns.difficulties[item[0]]):
+            games_total = self.averages.get((difficulty, user_code))
+            if games_total is None:
+                continue
+            average = games_total[1] / games_total[0]
+            players = len(averages)
+            below = bisect_left(averages, average)
+            percentile = 100.0 * below / (players - 1) if players > 1 else 100.0
+            ranks.append(Rank(self.columns.difficulties[difficulty], percentile, average, players))
+        return ranks
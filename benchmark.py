@@ -0,0 +1,241 @@
+"""Keystroke latency benchmark for the typing speed game
+
+Replays synthetic typist traces against passages of increasing length and
+times the scoring engine and the highlighting layer separately, using a
+headless stand-in for the Tk Text widget. Results are written as JSON so
+runs can be compared against a saved baseline:
+
+    python benchmark.py --output bench.json
+    python benchmark.py --baseline bench.json --threshold 1.5
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import typing_engine
+from typing_engine import TypingSession
+from TypingSpeedGame import TextHighlighter
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+
+
+class HeadlessText:
+    """Stand-in for tk.Text that only counts the tag calls made on it"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def tag_add(self, tag, *indices):
+        self.calls += 1
+
+    def tag_remove(self, tag, *indices):
+        self.calls += 1
+
+
+class SyntheticTypist:
+    """Generates a timestamped trace of Entry contents for a passage"""
+
+    def __init__(self, name, wpm=60, error_rate=0.02, max_backspace_burst=1,
+                 paste_rate=0.0, seed=0):
+        self.name = name
+        self.wpm = wpm
+        self.error_rate = error_rate
+        self.max_backspace_burst = max_backspace_burst
+        self.paste_rate = paste_rate
+        self.rng = random.Random(seed)
+
+    def events(self, text, start, count):
+        """Yield (timestamp, typed_text) pairs, beginning with text[:start] typed"""
+        rng = self.rng
+        interval = 60 / (self.wpm * 5)
+        typed = text[:start]
+        timestamp = 0.0
+        for _ in range(count):
+            timestamp += interval * rng.uniform(0.5, 1.5)
+            pos = len(typed)
+            roll = rng.random()
+            if pos >= len(text):
+                typed = typed[:-1]
+            elif roll < self.paste_rate:
+                typed += text[pos:pos + rng.randint(10, 50)]
+            elif roll < self.paste_rate + self.error_rate:
+                typed += rng.choice("abcdefghijklmnopqrstuvwxyz ")
+            elif pos and rng.random() < self.error_rate and typed[-1] != text[pos - 1]:
+                # Noticed a mistake: back up a few characters
+                typed = typed[:-rng.randint(1, self.max_backspace_burst)]
+            else:
+                typed += text[pos]
+            yield timestamp, typed
+
+
+TYPISTS = [
+    dict(name="steady", wpm=60, error_rate=0.02),
+    dict(name="fast", wpm=150, error_rate=0.05, max_backspace_burst=3),
+    dict(name="sloppy", wpm=40, error_rate=0.15, max_backspace_burst=6),
+    dict(name="paster", wpm=80, error_rate=0.03, paste_rate=0.05),
+]
+
+
+def build_passage(length, difficulty="Medium", seed=0):
+    """Passage of exactly length characters made from generated text"""
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    while size < length:
+        chunk = typing_engine.generate_text(difficulty, rng)
+        parts.append(chunk)
+        size += len(chunk) + 1
+    return " ".join(parts)[:length]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies, total_time):
+    """Latency percentiles in microseconds plus throughput"""
+    latencies.sort()
+    return {
+        "p50_us": round(percentile(latencies, 50) * 1e6, 2),
+        "p95_us": round(percentile(latencies, 95) * 1e6, 2),
+        "p99_us": round(percentile(latencies, 99) * 1e6, 2),
+        "max_us": round(latencies[-1] * 1e6, 2) if latencies else 0.0,
+        "events_per_sec": round(len(latencies) / total_time, 1) if total_time > 0 else 0.0,
+    }
+
+
+def run_trace(text, trace):
+    """Feed a trace through a session and highlighter, timing each stage
+
+    Stops once the session finishes: later feeds return without doing any
+    work and would only dilute the timings.
+    """
+    session = TypingSession(text, time_limit=0)
+    widget = HeadlessText()
+    highlighter = TextHighlighter(widget)
+    scoring = []
+    rendering = []
+    clock = time.perf_counter
+    session.start(0.0)
+    for timestamp, typed in trace:
+        t0 = clock()
+        start, end = session.feed(typed, timestamp)
+        t1 = clock()
+        highlighter.invalidate(start, end)
+        highlighter.render(session.scorer.marks, session.scorer.cursor, len(text))
+        t2 = clock()
+        scoring.append(t1 - t0)
+        rendering.append(t2 - t1)
+        if session.finished:
+            break
+    return scoring, rendering, widget.calls
+
+
+def measure_allocations(text, trace):
+    """Peak bytes allocated while replaying a trace"""
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        run_trace(text, trace)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - baseline
+
+
+def run_case(length, typist_config, events):
+    """Benchmark one passage length against one typist profile"""
+    text = build_passage(length)
+    # Start late in the passage, where per-key cost used to be worst, but
+    # leave room for the whole trace: pastes average 30 characters
+    typist = SyntheticTypist(seed=length, **typist_config)
+    advance = 1 + 30 * typist.paste_rate
+    start = max(0, length - int(events * advance * 1.2))
+    trace = list(typist.events(text, start, events))
+
+    # Prime the engine with the prefix so only the live keystrokes are timed
+    trace.insert(0, (0.0, text[:start]))
+    scoring, rendering, calls = run_trace(text, trace)
+    scoring, rendering = scoring[1:], rendering[1:]
+    trace = trace[:len(scoring) + 1]  # short passages finish before the trace does
+
+    return {
+        "passage_length": length,
+        "typist": typist_config["name"],
+        "events": len(scoring),
+        "scoring": dict(summarize(scoring, sum(scoring)),
+                        alloc_peak_bytes=measure_allocations(text, trace)),
+        "rendering": dict(summarize(rendering, sum(rendering)),
+                          tk_calls_per_event=round(calls / max(1, len(scoring)), 2)),
+    }
+
+
+def compare(report, baseline, threshold, min_delta_us=2.0):
+    """Return messages for cases whose p95 regressed past threshold x baseline
+
+    Differences smaller than min_delta_us are treated as timer noise.
+    """
+    previous = {(r["passage_length"], r["typist"]): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        old = previous.get((result["passage_length"], result["typist"]))
+        if old is None:
+            continue
+        for stage in ("scoring", "rendering"):
+            new_p95 = result[stage]["p95_us"]
+            old_p95 = old[stage]["p95_us"]
+            if new_p95 > old_p95 * threshold and new_p95 - old_p95 >= min_delta_us:
+                regressions.append(
+                    f"{stage} p95 for {result['typist']} @ {result['passage_length']} chars: "
+                    f"{old_p95}us -> {new_p95}us"
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark per-keystroke scoring and highlighting")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="passage lengths in characters")
+    parser.add_argument("--events", type=int, default=2000, help="keystrokes replayed per case")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="previous JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=1.5,
+                        help="fail when p95 exceeds the baseline by this factor")
+    parser.add_argument("--min-delta-us", type=float, default=2.0,
+                        help="ignore p95 increases smaller than this many microseconds")
+    args = parser.parse_args(argv)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "events_per_case": args.events,
+        "results": [run_case(size, typist, args.events) for size in args.sizes for typist in TYPISTS],
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold, args.min_delta_us)
+        for message in regressions:
+            print(f"REGRESSION: {message}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
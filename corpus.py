@@ -0,0 +1,203 @@
+"""Word corpus with difficulty tiers and precomputed weighted sampling
+
+A corpus file holds one word or phrase per line, optionally followed by a
+tab and a frequency count used as its sampling weight. The first load
+scores every entry, splits the corpus into Easy/Medium/Hard tiers and
+writes a binary index next to the file (or in the user cache directory).
+Later launches read the index and memory-map the corpus instead of
+parsing it, and entries are only decoded when they are sampled.
+"""
+import mmap
+import os
+import random
+import struct
+from array import array
+from bisect import bisect_right
+
+TIERS = ("Easy", "Medium", "Hard")
+
+INDEX_MAGIC = b"TSGIDX1\0"
+INDEX_HEADER = struct.Struct("<8sQQ")  # magic, source size, source mtime (ns)
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "typing-speed-game")
+
+
+def _letter_rarity(entries):
+    """Map each character to 0 (most common in the corpus) .. 1 (rarest)"""
+    counts = {}
+    for entry in entries:
+        for char in entry:
+            counts[char] = counts.get(char, 0) + 1
+    most = max(counts.values(), default=1)
+    return {char: 1 - count / most for char, count in counts.items()}
+
+
+def difficulty_score(entry, rarity):
+    """Longer entries built from rarer characters score higher"""
+    if not entry:
+        return 0.0
+    mean_rarity = sum(rarity.get(char, 1.0) for char in entry) / len(entry)
+    return len(entry) * (1 + mean_rarity)
+
+
+def assign_tiers(entries):
+    """Split entries into Easy/Medium/Hard by difficulty score tertiles"""
+    rarity = _letter_rarity(entries)
+    ranked = sorted(range(len(entries)), key=lambda i: difficulty_score(entries[i], rarity))
+    tiers = {}
+    for rank, i in enumerate(ranked):
+        tiers[i] = TIERS[min(len(TIERS) - 1, rank * len(TIERS) // max(1, len(ranked)))]
+    return tiers
+
+
+class Tier:
+    """Entries of one difficulty level with cumulative sampling weights"""
+
+    def __init__(self, offsets, lengths, cum_weights):
+        self.offsets = offsets
+        self.lengths = lengths
+        self.cum_weights = cum_weights
+
+    def __len__(self):
+        return len(self.offsets)
+
+
+class Corpus:
+    """Tiered word source that samples many entries per call"""
+
+    def __init__(self, data, tiers):
+        self.data = data
+        self.tiers = tiers
+
+    @classmethod
+    def from_word_lists(cls, word_lists):
+        """Build an in-memory corpus from {tier: [words]}, dropping duplicates"""
+        chunks = []
+        tiers = {}
+        offset = 0
+        for name, words in word_lists.items():
+            offsets, lengths, cum_weights = array("Q"), array("I"), array("d")
+            for word in dict.fromkeys(words):
+                encoded = word.encode("utf-8")
+                chunks.append(encoded)
+                offsets.append(offset)
+                lengths.append(len(encoded))
+                cum_weights.append((cum_weights[-1] if cum_weights else 0.0) + 1.0)
+                offset += len(encoded)
+            tiers[name] = Tier(offsets, lengths, cum_weights)
+        return cls(b"".join(chunks), tiers)
+
+    @classmethod
+    def load(cls, path, cache_dir=None):
+        """Open a corpus file, building its index on first use"""
+        handle = open(path, "rb")
+        try:
+            stat = os.fstat(handle.fileno())
+            data = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        finally:
+            handle.close()
+
+        index_path = cls._index_path(path, cache_dir)
+        tiers = cls._read_index(index_path, stat)
+        if tiers is None:
+            tiers = cls._build_index(data)
+            cls._write_index(index_path, stat, tiers)
+        return cls(data, tiers)
+
+    @staticmethod
+    def _index_path(path, cache_dir):
+        if cache_dir is None:
+            directory = os.path.dirname(os.path.abspath(path))
+            if os.access(directory, os.W_OK):
+                return os.path.abspath(path) + ".idx"
+            cache_dir = CACHE_DIR
+        name = os.path.abspath(path).strip(os.sep).replace(os.sep, "_")
+        return os.path.join(cache_dir, name + ".idx")
+
+    @staticmethod
+    def _build_index(data):
+        """Scan the corpus once, scoring entries and assigning tiers"""
+        entries = []
+        positions = []
+        weights = []
+        seen = set()
+        offset = 0
+        for line in bytes(data).split(b"\n"):
+            start = offset
+            offset += len(line) + 1
+            word, _, count = line.rstrip(b"\r").partition(b"\t")
+            word = word.strip()
+            if not word or word in seen:
+                continue
+            seen.add(word)
+            try:
+                weight = float(count) if count.strip() else 1.0
+            except ValueError:
+                weight = 1.0
+            if weight <= 0:
+                continue
+            entries.append(word.decode("utf-8", "replace"))
+            positions.append((start + line.index(word), len(word)))
+            weights.append(weight)
+
+        tier_of = assign_tiers(entries)
+        tiers = {name: (array("Q"), array("I"), array("d")) for name in TIERS}
+        for i, (start, length) in enumerate(positions):
+            offsets, lengths, cum_weights = tiers[tier_of[i]]
+            offsets.append(start)
+            lengths.append(length)
+            cum_weights.append((cum_weights[-1] if cum_weights else 0.0) + weights[i])
+        return {name: Tier(*columns) for name, columns in tiers.items()}
+
+    @staticmethod
+    def _read_index(index_path, stat):
+        try:
+            with open(index_path, "rb") as f:
+                magic, size, mtime = INDEX_HEADER.unpack(f.read(INDEX_HEADER.size))
+                if magic != INDEX_MAGIC or size != stat.st_size or mtime != stat.st_mtime_ns:
+                    return None
+                tiers = {}
+                for name in TIERS:
+                    (count,) = struct.unpack("<Q", f.read(8))
+                    columns = (array("Q"), array("I"), array("d"))
+                    for column in columns:
+                        column.fromfile(f, count)
+                    tiers[name] = Tier(*columns)
+                return tiers
+        except (OSError, EOFError, struct.error):
+            return None
+
+    @staticmethod
+    def _write_index(index_path, stat, tiers):
+        """Save the index; a failure only means the next launch rebuilds it"""
+        try:
+            os.makedirs(os.path.dirname(index_path), exist_ok=True)
+            tmp_path = index_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(INDEX_HEADER.pack(INDEX_MAGIC, stat.st_size, stat.st_mtime_ns))
+                for name in TIERS:
+                    tier = tiers[name]
+                    f.write(struct.pack("<Q", len(tier)))
+                    tier.offsets.tofile(f)
+                    tier.lengths.tofile(f)
+                    tier.cum_weights.tofile(f)
+            os.replace(tmp_path, index_path)
+        except OSError:
+            pass
+
+    def entry(self, tier, index):
+        """Decode one entry of a tier"""
+        start = tier.offsets[index]
+        return self.data[start:start + tier.lengths[index]].decode("utf-8", "replace")
+
+    def sample(self, difficulty, k, rng=random):
+        """Draw k entries from a tier, weighted by frequency"""
+        tier = self.tiers[difficulty]
+        if not len(tier):
+            raise ValueError(f"corpus has no {difficulty} entries")
+        total = tier.cum_weights[-1]
+        cum_weights = tier.cum_weights
+        last = len(tier) - 1
+        return [
+            self.entry(tier, min(bisect_right(cum_weights, rng.random() * total), last))
+            for _ in range(k)
+        ]
@@ -0,0 +1,142 @@
+"""Offline grading of recorded typing sessions
+
+Re-scores every recording (as written by the game's --record option) in a
+directory tree with the same engine, WPM/accuracy rules and performance
+rating as the game. Work is spread over a process pool in small batches;
+only a bounded number of batches is in flight and each result row is
+written as soon as its batch finishes, so memory does not grow with the
+number of recordings.
+
+    python grading.py recordings/ --output grades.csv
+    python grading.py recordings/ --format jsonl --workers 8
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+from typing_engine import replay_recording
+
+FIELDS = ["file", "user", "difficulty", "time_limit", "wpm", "accuracy", "elapsed_time", "rating", "error"]
+
+
+def iter_recordings(directory):
+    """Yield recording paths under directory without listing it all at once"""
+    stack = [directory]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".json"):
+                    yield entry.path
+
+
+def grade_recording(path):
+    """Score one recording, reporting problems in the error column"""
+    row = dict.fromkeys(FIELDS, "")
+    row["file"] = path
+    try:
+        with open(path, encoding="utf-8") as f:
+            recording = json.load(f)
+        if not isinstance(recording, dict):
+            raise ValueError(f"expected a JSON object, not {type(recording).__name__}")
+        session = replay_recording(recording)
+    except Exception as exc:
+        # Any "*.json" can turn up here; one bad file must not end the run
+        row["error"] = f"{type(exc).__name__}: {exc}"
+        return row
+
+    result = session.result()
+    row.update(
+        user=recording.get("user", ""),
+        difficulty=session.difficulty,
+        time_limit=session.time_limit,
+        wpm=result.wpm,
+        accuracy=result.accuracy,
+        elapsed_time=round(result.elapsed_time, 3),
+        rating=result.rating,
+    )
+    return row
+
+
+def grade_batch(paths):
+    return [grade_recording(path) for path in paths]
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class RowWriter:
+    """Streams result rows as CSV or JSON lines"""
+
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == "csv":
+            self.csv = csv.DictWriter(stream, fieldnames=FIELDS)
+            self.csv.writeheader()
+
+    def write(self, row):
+        if self.fmt == "csv":
+            self.csv.writerow(row)
+        else:
+            self.stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def grade_directory(directory, writer, workers=None, batch_size=64):
+    """Grade every recording under directory; returns (graded, failed)"""
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * 4
+    graded = failed = 0
+
+    def collect(futures):
+        nonlocal graded, failed
+        for future in futures:
+            for row in future.result():
+                writer.write(row)
+                graded += 1
+                failed += 1 if row["error"] else 0
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = set()
+        for batch in batched(iter_recordings(directory), batch_size):
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(pool.submit(grade_batch, batch))
+        collect(pending)
+    return graded, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-score recorded typing sessions")
+    parser.add_argument("directory", help="directory of recordings (searched recursively)")
+    parser.add_argument("--output", help="write results here instead of stdout")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=64, help="recordings per task")
+    args = parser.parse_args(argv)
+
+    stream = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    try:
+        graded, failed = grade_directory(args.directory, RowWriter(stream, args.format),
+                                         args.workers, args.batch_size)
+    finally:
+        if args.output:
+            stream.close()
+    print(f"graded {graded} recordings ({failed} failed)", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
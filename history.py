@@ -0,0 +1,333 @@
+"""SQLite-backed history of finished games
+
+All database work happens on one background thread. Finished games are
+queued and written in batches, and queries run on the same thread with
+their results handed back through a queue the UI drains on its own
+schedule, so the game window never waits on disk. Per-user aggregates
+are maintained as sessions are written, so leaderboards read a small
+summary table instead of scanning every session. Per-word timings are
+folded into running totals per user, difficulty and word the same way,
+which is where the hot spots come from. Progress reports come from an
+analytics.ProgressAnalytics kept on the store thread and topped up with
+the sessions written since it last looked.
+"""
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from analytics import COLUMNS, ProgressAnalytics
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".local", "share", "typing-speed-game", "history.db")
+
+# Seconds to wait for another process (a second game or kiosk) holding the database lock
+BUSY_TIMEOUT = 5.0
+
+SessionRecord = namedtuple(
+    "SessionRecord", "user difficulty time_limit wpm accuracy elapsed_time created_at"
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    time_limit INTEGER NOT NULL,
+    wpm INTEGER NOT NULL,
+    accuracy INTEGER NOT NULL,
+    elapsed_time REAL NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_user_time ON sessions (user, created_at);
+CREATE INDEX IF NOT EXISTS sessions_difficulty_wpm ON sessions (difficulty, wpm DESC);
+CREATE INDEX IF NOT EXISTS sessions_time ON sessions (created_at);
+
+CREATE TABLE IF NOT EXISTS user_stats (
+    user TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    games INTEGER NOT NULL,
+    best_wpm INTEGER NOT NULL,
+    total_wpm INTEGER NOT NULL,
+    total_accuracy INTEGER NOT NULL,
+    last_played REAL NOT NULL,
+    PRIMARY KEY (user, difficulty)
+);
+CREATE INDEX IF NOT EXISTS user_stats_best ON user_stats (difficulty, best_wpm DESC);
+
+CREATE TABLE IF NOT EXISTS word_stats (
+    user TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    word TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    total_time REAL NOT NULL,
+    total_hesitation REAL NOT NULL,
+    errors INTEGER NOT NULL,
+    corrections INTEGER NOT NULL,
+    PRIMARY KEY (user, difficulty, word)
+);
+"""
+
+# Keystroke rhythm per session, added after the sessions table first shipped
+RHYTHM_COLUMNS = (
+    ("keystrokes", "INTEGER"),
+    ("interval_mean", "REAL"),
+    ("interval_var", "REAL"),
+    ("bursts", "INTEGER"),
+    ("pauses", "INTEGER"),
+)
+
+UPSERT_STATS = """
+INSERT INTO user_stats (user, difficulty, games, best_wpm, total_wpm, total_accuracy, last_played)
+VALUES (?, ?, 1, ?, ?, ?, ?)
+ON CONFLICT (user, difficulty) DO UPDATE SET
+    games = games + 1,
+    best_wpm = MAX(best_wpm, excluded.best_wpm),
+    total_wpm = total_wpm + excluded.total_wpm,
+    total_accuracy = total_accuracy + excluded.total_accuracy,
+    last_played = MAX(last_played, excluded.last_played)
+"""
+
+UPSERT_WORDS = """
+INSERT INTO word_stats (user, difficulty, word, attempts, total_time, total_hesitation, errors, corrections)
+VALUES (?, ?, ?, 1, ?, ?, ?, ?)
+ON CONFLICT (user, difficulty, word) DO UPDATE SET
+    attempts = attempts + 1,
+    total_time = total_time + excluded.total_time,
+    total_hesitation = total_hesitation + excluded.total_hesitation,
+    errors = errors + excluded.errors,
+    corrections = corrections + excluded.corrections
+"""
+
+
+class ResultsStore:
+    """History database owned by a background writer thread"""
+
+    def __init__(self, path=DEFAULT_PATH, batch_size=64, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.analytics = None
+        self.thread = threading.Thread(target=self._run, name="results-store", daemon=True)
+        self.thread.start()
+
+    # Called from the UI thread
+
+    def record(self, user, difficulty, time_limit, wpm, accuracy, elapsed_time, created_at=None, words=(),
+               rhythm=None):
+        """Queue a finished game for writing; words are its WordStats, rhythm its Rhythm"""
+        if created_at is None:
+            created_at = time.time()
+        self.requests.put(("write", (SessionRecord(
+            user, difficulty, time_limit, wpm, accuracy, elapsed_time, created_at
+        ), words, rhythm)))
+
+    def query_async(self, callback, method, *args):
+        """Run a query method on the store thread; callback gets its result
+
+        Callbacks run when the caller drains them with dispatch_results.
+        """
+        self.requests.put(("query", (callback, method, args)))
+
+    def dispatch_results(self):
+        """Invoke callbacks for queries that have finished"""
+        while True:
+            try:
+                callback, result = self.results.get_nowait()
+            except queue.Empty:
+                return
+            callback(result)
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far has been written
+
+        Returns False on timeout or if the database could not be written;
+        unwritten games stay queued and are retried.
+        """
+        done = threading.Event()
+        done.written = False
+        self.requests.put(("flush", done))
+        return done.wait(timeout) and done.written
+
+    def close(self, timeout=5):
+        """Write what is queued and stop the store thread"""
+        self.requests.put(("close", None))
+        self.thread.join(timeout)
+
+    # Store thread
+
+    def _open(self):
+        """Connect and bring the schema up to date; errors leave self.db unset for a later retry"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            existing = {row[1] for row in db.execute("PRAGMA table_info(sessions)")}
+            with db:
+                for name, kind in RHYTHM_COLUMNS:
+                    if name not in existing:
+                        db.execute(f"ALTER TABLE sessions ADD COLUMN {name} {kind}")
+        except BaseException:
+            db.close()
+            raise
+        self.db = db
+
+    def _run(self):
+        # Nothing here may kill the thread: a locked or unreachable database
+        # fails one write or query, and pending games are retried later
+        self.db = None
+        pending = []
+        running = True
+        while running:
+            try:
+                kind, payload = self.requests.get(timeout=self.flush_interval if pending else None)
+            except queue.Empty:
+                self._write(pending)
+                continue
+
+            if kind == "write":
+                pending.append(payload)
+                if len(pending) >= self.batch_size:
+                    self._write(pending)
+                continue
+
+            # Anything else sees all earlier writes
+            written = self._write(pending)
+            if kind == "query":
+                callback, method, args = payload
+                try:
+                    if self.db is None:
+                        self._open()
+                    result = getattr(self, method)(*args)
+                except Exception as exc:
+                    result = exc
+                self.results.put((callback, result))
+            elif kind == "flush":
+                payload.written = written
+                payload.set()
+            elif kind == "close":
+                running = False
+        if self.db is not None:
+            self.db.close()
+
+    def _write(self, pending):
+        """Insert a batch of sessions and fold them into the aggregates
+
+        If the database is locked, busy or unreachable the batch stays
+        pending and is retried on the next write or flush. Any other error
+        would fail forever, so the batch is retried game by game and the
+        games that still fail are reported and dropped. Returns whether
+        everything pending was written.
+        """
+        if not pending:
+            return True
+        try:
+            if self.db is None:
+                self._open()
+            self._insert(pending)
+        except (sqlite3.OperationalError, OSError):
+            return False
+        except Exception:
+            # Save what can be saved one game at a time and drop the rest
+            kept = []
+            for entry in pending:
+                try:
+                    self._insert([entry])
+                except sqlite3.OperationalError:
+                    kept.append(entry)
+                except Exception as exc:
+                    print(f"history: dropped a game that cannot be saved: {exc!r}", file=sys.stderr)
+            pending[:] = kept
+            return False
+        pending.clear()
+        return True
+
+    def _insert(self, pending):
+        records = [record for record, _, _ in pending]
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO sessions (user, difficulty, time_limit, wpm, accuracy, elapsed_time, created_at,"
+                " keystrokes, interval_mean, interval_var, bursts, pauses)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [tuple(record) + (tuple(rhythm) if rhythm else (None,) * 5) for record, _, rhythm in pending],
+            )
+            self.db.executemany(
+                UPSERT_STATS,
+                [(r.user, r.difficulty, r.wpm, r.wpm, r.accuracy, r.created_at) for r in records],
+            )
+            self.db.executemany(
+                UPSERT_WORDS,
+                [
+                    (r.user, r.difficulty, w.word, w.time, w.hesitation, w.errors, w.corrections)
+                    for r, words, _ in pending for w in words
+                ],
+            )
+
+    # Queries, run on the store thread through query_async
+
+    def leaderboard(self, difficulty, limit=10):
+        """Best WPM per user for a difficulty, as (user, best_wpm, games, average_wpm)"""
+        return self.db.execute(
+            "SELECT user, best_wpm, games, total_wpm * 1.0 / games FROM user_stats"
+            " WHERE difficulty = ? ORDER BY best_wpm DESC LIMIT ?",
+            (difficulty, limit),
+        ).fetchall()
+
+    def user_summary(self, user):
+        """Per-difficulty (difficulty, games, best_wpm, average_wpm, average_accuracy) for a user"""
+        return self.db.execute(
+            "SELECT difficulty, games, best_wpm, total_wpm * 1.0 / games, total_accuracy * 1.0 / games"
+            " FROM user_stats WHERE user = ? ORDER BY difficulty",
+            (user,),
+        ).fetchall()
+
+    def hot_spots(self, user, difficulty, limit=10, min_attempts=2):
+        """Slowest words per character for a user, as (word, attempts, average_time, average_hesitation, error_rate)"""
+        return self.db.execute(
+            "SELECT word, attempts, total_time / attempts, total_hesitation / attempts,"
+            " errors * 1.0 / attempts FROM word_stats"
+            " WHERE user = ? AND difficulty = ? AND attempts >= ?"
+            " ORDER BY total_time / (attempts * (length(word) + 1)) DESC LIMIT ?",
+            (user, difficulty, min_attempts, limit),
+        ).fetchall()
+
+    def progress(self, user):
+        """A user's analytics.ProgressReport (None without games), with new sessions folded in"""
+        if self.analytics is None:
+            self.analytics = ProgressAnalytics()
+        rows = self.db.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM sessions WHERE id > ? ORDER BY id",
+            (self.analytics.columns.last_id,),
+        )
+        self.analytics.update(rows)
+        return self.analytics.report(user)
+
+    def sessions(self, user=None, difficulty=None, since=None, until=None, limit=100):
+        """Most recent sessions matching the filters, newest first"""
+        clauses = []
+        params = []
+        for column, op, value in (
+            ("user", "=", user),
+            ("difficulty", "=", difficulty),
+            ("created_at", ">=", since),
+            ("created_at", "<", until),
+        ):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit)
+        rows = self.db.execute(
+            "SELECT user, difficulty, time_limit, wpm, accuracy, elapsed_time, created_at"
+            f" FROM sessions{where} ORDER BY created_at DESC LIMIT ?",
+            params,
+        ).fetchall()
+        return [SessionRecord(*row) for row in rows]
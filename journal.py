@@ -0,0 +1,279 @@
+"""Crash-safe journal of the game in progress
+
+While a game runs its keystroke log is appended to a small binary file,
+so a crash, a killed process or a machine that never wakes up again
+costs at most the last second of typing. The UI thread only slices new
+events out of the session's log columns and queues the bytes; a
+background thread does the buffered writes and fsyncs them in batches,
+so journaling stays off the keystroke path.
+
+The file is a header followed by framed records (kind, length, CRC-32,
+payload). A torn write at the end fails its CRC and is ignored. Compact
+snapshots of the window text, input, offset and counters are written
+once the events since the previous snapshot take more space than a new
+one would, so recovery replays a bounded tail and snapshots at most
+double the bytes written.
+"""
+import json
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from array import array
+
+from typing_engine import EDIT_DELETE, KeystrokeLog, TypingSession, WordIndex
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".local", "share", "typing-speed-game", "journal")
+
+MAGIC = b"TSGJNL1\n"
+RECORD = struct.Struct("<BII")  # kind, payload length, CRC-32 of the payload
+COUNT = struct.Struct("<I")
+
+START = 1
+EVENTS = 2
+SNAPSHOT = 3
+
+# Bytes per event in an EVENTS record: timestamp, position, char, correct, kind
+EVENT_SIZE = 8 + 4 + 4 + 1 + 1
+
+
+def encode_record(kind, payload):
+    return RECORD.pack(kind, len(payload), zlib.crc32(payload)) + payload
+
+
+def encode_json(kind, data):
+    return encode_record(kind, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+class SessionJournal:
+    """Append-only journal for one session, written by a background thread"""
+
+    def __init__(self, path, session, sync_interval=1.0, **metadata):
+        self.path = path
+        self.session = session
+        self.sync_interval = sync_interval
+        self.written = 0  # events journaled, counting ones the log has since dropped
+        self.since_snapshot = 0
+        self.snapshot_offset = None
+        self.snapshot_text = None
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="session-journal", daemon=True)
+        self.thread.start()
+
+        start = dict(metadata)
+        start.update({
+            "difficulty": session.difficulty,
+            "time_limit": session.time_limit,
+            "endless": session.endless,
+            "scoring": session.scoring,
+            "start_time": session.start_time,
+        })
+        self.requests.put(("write", MAGIC + encode_json(START, start)))
+        self.sync()
+
+    # Called from the UI thread
+
+    def sync(self):
+        """Queue events logged since the last call, plus a snapshot if one is due"""
+        session = self.session
+        log = session.log
+        total = log.dropped + len(log)
+        chunks = []
+        if total > self.written:
+            # Events the log dropped before they were journaled are lost
+            first = max(0, self.written - log.dropped)
+            count = len(log) - first
+            chunks.append(encode_record(EVENTS, b"".join((
+                COUNT.pack(count),
+                log.timestamps[first:].tobytes(),
+                log.positions[first:].tobytes(),
+                log.chars[first:].tobytes(),
+                log.correct[first:].tobytes(),
+                log.kinds[first:].tobytes(),
+            ))))
+            self.written = total
+            self.since_snapshot += count * EVENT_SIZE
+
+        text = session.text
+        typed = session.scorer.typed
+        if (session.offset != self.snapshot_offset or text is not self.snapshot_text
+                or self.since_snapshot > len(typed) + 64):
+            chunks.append(encode_json(SNAPSHOT, {
+                "offset": session.offset,
+                "typed": typed,
+                "committed_correct": session.committed_correct,
+                "elapsed": session.elapsed_time(),
+                # The window only changes in endless mode
+                "text": text if text is not self.snapshot_text else None,
+            }))
+            self.snapshot_offset = session.offset
+            self.snapshot_text = text
+            self.since_snapshot = 0
+        if chunks:
+            self.requests.put(("write", b"".join(chunks)))
+
+    def close(self, delete=False):
+        """Flush everything queued; delete=True removes the file once the game is saved"""
+        self.requests.put(("close", delete))
+        self.thread.join()
+
+    # Journal thread
+
+    def _run(self):
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            f = open(self.path, "ab", buffering=64 * 1024)
+        except OSError:
+            # Journaling is best effort; keep draining so the game is unaffected
+            f = None
+        dirty = False
+        next_sync = 0.0
+        while True:
+            timeout = max(0.0, next_sync - time.monotonic()) if dirty else None
+            try:
+                kind, payload = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                kind = None
+            try:
+                if kind == "close":
+                    if f is not None:
+                        f.close()
+                        if payload:
+                            os.remove(self.path)
+                        else:
+                            fsync_path(self.path)
+                    return
+                if kind == "write" and f is not None:
+                    f.write(payload)
+                    if not dirty:
+                        dirty = True
+                        next_sync = time.monotonic() + self.sync_interval
+                if dirty and time.monotonic() >= next_sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    dirty = False
+            except OSError:
+                if f is not None and not f.closed:
+                    f.close()
+                f = None
+                dirty = False
+
+
+def fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class JournalState:
+    """What a journal says about its session at the last intact record"""
+
+    def __init__(self, start):
+        self.difficulty = start["difficulty"]
+        self.time_limit = start["time_limit"]
+        self.endless = start["endless"]
+        self.scoring = start.get("scoring", "positional")
+        self.start_time = start["start_time"]
+        self.metadata = start
+        self.log = KeystrokeLog()
+        self.text = ""
+        self.offset = 0
+        self.typed = ""
+        self.committed_correct = 0
+        self.elapsed = 0.0
+
+    def apply_events(self, first):
+        """Roll the input forward over log events from index first on"""
+        log = self.log
+        typed = self.typed
+        for i in range(first, len(log)):
+            position = log.positions[i] - self.offset
+            if log.kinds[i] == EDIT_DELETE:
+                typed = typed[:position] + typed[position + 1:]
+            else:
+                typed = typed[:position] + chr(log.chars[i]) + typed[position:]
+            self.elapsed = max(self.elapsed, log.timestamps[i] - self.start_time)
+        self.typed = typed
+
+
+def read_journal(path):
+    """Recover a JournalState from a journal, stopping at the first damaged record"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a session journal")
+
+    state = None
+    applied = 0  # log events already reflected in state.typed
+    pos = len(MAGIC)
+    while pos + RECORD.size <= len(data):
+        kind, length, crc = RECORD.unpack_from(data, pos)
+        payload = data[pos + RECORD.size:pos + RECORD.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        pos += RECORD.size + length
+
+        if kind == START:
+            state = JournalState(json.loads(payload))
+        elif state is None:
+            break
+        elif kind == EVENTS:
+            (count,) = COUNT.unpack_from(payload)
+            columns = COUNT.size
+            log = state.log
+            for column in (log.timestamps, log.positions, log.chars, log.correct, log.kinds):
+                size = column.itemsize * count
+                column.frombytes(payload[columns:columns + size])
+                columns += size
+        elif kind == SNAPSHOT:
+            snapshot = json.loads(payload)
+            if snapshot["text"] is not None:
+                state.text = snapshot["text"]
+            state.offset = snapshot["offset"]
+            state.typed = snapshot["typed"]
+            state.committed_correct = snapshot["committed_correct"]
+            state.elapsed = max(state.elapsed, snapshot["elapsed"])
+            applied = len(state.log)
+
+    if state is None:
+        raise ValueError(f"{path} has no intact start record")
+    state.apply_events(applied)
+    return state
+
+
+def restore_session(state, clock=time.monotonic, text_source=None):
+    """A running TypingSession picking up where the journal left off
+
+    Time spent while the game was not running does not count, so the
+    session restarts with the journaled elapsed time already on the clock.
+    """
+    session = TypingSession(state.text, state.time_limit, state.difficulty, clock,
+                            text_source=text_source, scoring=state.scoring)
+    session.start(clock() - state.elapsed)
+    session.offset = state.offset
+    session.words = WordIndex(state.text, state.offset)
+    session.committed_correct = state.committed_correct
+    session.scorer.update(state.typed)
+
+    # Keep the history on the new clock so it can still be recorded
+    shift = session.start_time - state.start_time
+    log = state.log
+    log.timestamps = array("d", (timestamp + shift for timestamp in log.timestamps))
+    session.log = log
+    return session
+
+
+def find_journals(directory=DEFAULT_DIR):
+    """Journals left behind by games that never finished, newest first"""
+    try:
+        entries = [entry for entry in os.scandir(directory) if entry.name.endswith(".journal")]
+    except OSError:
+        return []
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    return [entry.path for entry in entries]
@@ -0,0 +1,175 @@
+"""Prometheus metrics for unattended game kiosks
+
+MetricsExporter serves counters and histograms in the Prometheus text
+format over plain HTTP on localhost, from its own thread. The game only
+bumps counters and buckets at the start and end of each game, which is
+O(1) with fixed-size arrays. Keystroke latency and UI-loop stalls are
+read from the profiler's existing histograms at scrape time, so the
+keystroke path pays nothing beyond the profiler itself.
+
+    python TypingSpeedGame.py --metrics-port 9464
+    curl localhost:9464/metrics
+"""
+import math
+import threading
+from array import array
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+WPM_BOUNDS = (10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 120, 150)
+ACCURACY_BOUNDS = (50, 60, 70, 80, 85, 90, 95, 98, 100)
+
+# Profiler buckets merged per exported bucket, so each exported one doubles
+LATENCY_STRIDE = 4
+
+
+class Histogram:
+    """Per-bucket counts and a running sum over fixed bounds"""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = array("Q", bytes(8 * (len(bounds) + 1)))
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+def histogram_lines(name, labels, bounds, counts, total):
+    """Exposition lines for one histogram from per-bucket (not cumulative) counts"""
+    lines = []
+    seen = 0
+    for bound, count in zip(tuple(bounds) + (math.inf,), counts):
+        seen += count
+        lines.append(f"{name}_bucket{format_labels(dict(labels, le=format_value(bound)))} {seen}")
+    lines.append(f"{name}_sum{format_labels(labels)} {format_value(total)}")
+    lines.append(f"{name}_count{format_labels(labels)} {seen}")
+    return lines
+
+
+class GameMetrics:
+    """In-memory game counters and result distributions per difficulty
+
+    Updated on the Tk thread and rendered on the exporter's; each update
+    and each bucket copy is a single operation under the GIL, so a scrape
+    can at worst see a game counted in one metric but not yet the next.
+    """
+
+    def __init__(self, profiler=None):
+        self.profiler = profiler
+        self.started = {}
+        self.finished = {}
+        self.wpm = {}
+        self.accuracy = {}
+        self.in_progress = 0
+
+    def game_started(self, difficulty):
+        self.started[difficulty] = self.started.get(difficulty, 0) + 1
+        self.in_progress = 1
+
+    def game_finished(self, difficulty, wpm, accuracy):
+        self.finished[difficulty] = self.finished.get(difficulty, 0) + 1
+        self.in_progress = 0
+        for table, bounds, value in ((self.wpm, WPM_BOUNDS, wpm), (self.accuracy, ACCURACY_BOUNDS, accuracy)):
+            histogram = table.get(difficulty)
+            if histogram is None:
+                histogram = table[difficulty] = Histogram(bounds)
+            histogram.observe(value)
+
+    def render(self):
+        """The current metrics in the Prometheus text format"""
+        lines = [
+            "# HELP typing_game_in_progress Whether a game is being played",
+            "# TYPE typing_game_in_progress gauge",
+            f"typing_game_in_progress {self.in_progress}",
+        ]
+        for name, help_text, table in (
+            ("typing_games_started_total", "Games started", self.started),
+            ("typing_games_finished_total", "Games finished", self.finished),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for difficulty, count in sorted(table.copy().items()):
+                lines.append(f"{name}{format_labels({'difficulty': difficulty})} {count}")
+
+        for name, help_text, table in (
+            ("typing_game_wpm", "Final words per minute", self.wpm),
+            ("typing_game_accuracy_percent", "Final accuracy", self.accuracy),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for difficulty, histogram in sorted(table.copy().items()):
+                lines += histogram_lines(name, {"difficulty": difficulty}, histogram.bounds,
+                                         histogram.counts[:], histogram.total)
+
+        for stage, name, help_text in (
+            ("input", "typing_keystroke_seconds", "Time to score and log one input edit (usually one keystroke)"),
+            ("loop_stall", "typing_ui_stall_seconds", "How late periodic Tk callbacks fire"),
+        ):
+            histogram = self.profiler.stages.get(stage) if self.profiler else None
+            if histogram is None:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            lines += histogram_lines(name, {}, *coarse_buckets(histogram))
+        return "\n".join(lines) + "\n"
+
+
+def coarse_buckets(histogram, stride=LATENCY_STRIDE):
+    """(bounds, counts, total) of a profiling.LatencyHistogram merged stride buckets at a time"""
+    counts = histogram.counts[:]
+    bounds = tuple(float(f"{bound:.3g}") for bound in histogram.bounds[stride - 1::stride])
+    merged = [sum(counts[i:i + stride]) for i in range(0, len(bounds) * stride, stride)]
+    merged.append(sum(counts[len(bounds) * stride:]))
+    return bounds, merged, histogram.total
+
+
+class MetricsExporter:
+    """Serves GameMetrics over HTTP from a daemon thread"""
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        self.metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split("?", 1)[0] != "/metrics":
+                    handler.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                handler.send_response(200)
+                handler.send_header("Content-Type", CONTENT_TYPE)
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-exporter", daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,190 @@
+"""Low-overhead latency instrumentation for the typing speed game
+
+Timings go into fixed-size histograms with geometric buckets, so
+recording is a bisect and a counter increment and memory never grows.
+When profiling is off the instrumented methods are the original ones,
+so a disabled profiler costs nothing on the keystroke path.
+"""
+import json
+import math
+import time
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+# Bucket upper bounds from 1us to ~10s, four buckets per doubling
+BUCKET_BOUNDS = tuple(1e-6 * 2 ** (i / 4) for i in range(94))
+
+
+class LatencyHistogram:
+    """Counts of durations (seconds) per geometric bucket"""
+
+    def __init__(self, bounds=BUCKET_BOUNDS):
+        self.bounds = bounds
+        self.counts = array("Q", bytes(8 * (len(bounds) + 1)))
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the pct-th percentile, capped at the max"""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(pct / 100 * self.count)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean_us": round(self.total / self.count * 1e6, 2) if self.count else 0.0,
+            "p50_us": round(self.percentile(50) * 1e6, 2),
+            "p95_us": round(self.percentile(95) * 1e6, 2),
+            "p99_us": round(self.percentile(99) * 1e6, 2),
+            "max_us": round(self.max * 1e6, 2),
+            "buckets": [
+                [round(bound * 1e6, 3), count]
+                for bound, count in zip(self.bounds + (math.inf,), self.counts)
+                if count
+            ],
+        }
+
+
+class Profiler:
+    """Per-stage latency histograms for instrumented methods
+
+    instrument() swaps an instance attribute for a timed wrapper while the
+    profiler is enabled and restores the original when it is disabled.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = {}
+        self.targets = []
+        self.originals = []
+
+    def histogram(self, stage):
+        if stage not in self.stages:
+            self.stages[stage] = LatencyHistogram()
+        return self.stages[stage]
+
+    def instrument(self, obj, attribute, stage):
+        """Time calls to obj.attribute under stage whenever profiling is on"""
+        self.targets.append((obj, attribute, stage))
+        if self.enabled:
+            self._wrap(obj, attribute, stage)
+
+    def _wrap(self, obj, attribute, stage):
+        original = getattr(obj, attribute)
+        histogram = self.histogram(stage)
+        clock = time.perf_counter
+
+        @wraps(original)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                histogram.record(clock() - start)
+
+        self.originals.append((obj, attribute, obj.__dict__.get(attribute)))
+        setattr(obj, attribute, timed)
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        for obj, attribute, stage in self.targets:
+            self._wrap(obj, attribute, stage)
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        for obj, attribute, original in reversed(self.originals):
+            if original is None:
+                delattr(obj, attribute)
+            else:
+                setattr(obj, attribute, original)
+        self.originals = []
+
+    def summary(self):
+        """{stage: (p50, p95, p99)} in seconds"""
+        return {
+            stage: (h.percentile(50), h.percentile(95), h.percentile(99))
+            for stage, h in sorted(self.stages.items())
+        }
+
+    def dump(self, path, **metadata):
+        """Write every histogram and the given metadata as JSON"""
+        data = dict(metadata)
+        data["stages"] = {stage: h.to_dict() for stage, h in sorted(self.stages.items())}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+
+
+class StallMonitor:
+    """Measure how late a periodic Tk callback fires to detect UI-loop stalls"""
+
+    def __init__(self, root, histogram, interval=0.016):
+        self.root = root
+        self.histogram = histogram
+        self.interval = interval
+        self.expected = None
+        self.after_id = None
+
+    def start(self):
+        if self.after_id is None:
+            self._schedule()
+
+    def stop(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+    def _schedule(self):
+        self.expected = time.perf_counter() + self.interval
+        self.after_id = self.root.after(int(self.interval * 1000), self._beat)
+
+    def _beat(self):
+        self.histogram.record(max(0.0, time.perf_counter() - self.expected))
+        self._schedule()
+
+
+class PhaseTimer:
+    """Wall-clock durations of named phases, e.g. the steps of startup"""
+
+    def __init__(self, origin=None, clock=time.perf_counter):
+        self.clock = clock
+        self.origin = clock() if origin is None else origin
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.phases.append((name, self.clock() - start))
+
+    def mark(self, name):
+        """Record the time from the origin to now as a phase"""
+        self.phases.append((name, self.clock() - self.origin))
+
+    def to_dict(self):
+        return {name: round(seconds * 1000, 2) for name, seconds in self.phases}
+
+    def format(self):
+        return "\n".join(f"{name:<15}{seconds * 1000:>9.1f}ms" for name, seconds in self.phases)
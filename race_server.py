@@ -0,0 +1,462 @@
+"""Local multiplayer races for the typing speed game
+
+An asyncio server hosts rooms of racers. Everyone who is ready when a
+room's countdown runs out gets the same passage. Racers report their
+position whenever they like, but the server only keeps the latest value
+and broadcasts the positions that changed once per tick, so traffic
+scales with the tick rate rather than with keystrokes. Messages are
+newline-delimited JSON.
+
+    python race_server.py serve --port 8765
+    python race_server.py bots --count 300 --port 8765
+
+The game joins a race with --race HOST:PORT through RaceClient, which
+runs the connection on a background thread.
+"""
+import argparse
+import asyncio
+import json
+import queue
+import random
+import threading
+import time
+
+import typing_engine
+from typing_engine import TypingSession
+
+MAX_LINE = 4096  # longest message accepted from a client
+
+
+def encode(message):
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class Racer:
+    __slots__ = ("id", "name", "writer", "ready", "racing", "position", "finished",
+                 "wpm", "accuracy", "stale")
+
+    def __init__(self, racer_id, name, writer):
+        self.id = racer_id
+        self.name = name
+        self.writer = writer
+        self.ready = False
+        self.racing = False
+        self.position = 0
+        self.finished = False
+        self.wpm = 0
+        self.accuracy = 0
+        self.stale = False  # missed a broadcast and needs a full snapshot
+
+
+class Room:
+    """Racers sharing one passage, with changes broadcast once per tick"""
+
+    def __init__(self, name, server):
+        self.name = name
+        self.server = server
+        self.racers = {}
+        self.changed = set()
+        self.text = None
+        self.started_at = None
+        self.countdown = None
+        self.tick_task = None
+
+    @property
+    def racing(self):
+        return self.text is not None
+
+    def participants(self):
+        return [racer for racer in self.racers.values() if racer.racing]
+
+    def add(self, racer):
+        self.racers[racer.id] = racer
+        if self.tick_task is None:
+            self.tick_task = asyncio.ensure_future(self._tick_loop())
+
+    def remove(self, racer):
+        self.racers.pop(racer.id, None)
+        self.changed.discard(racer.id)
+        if racer.racing:
+            self.broadcast({"type": "left", "id": racer.id}, self.participants())
+            self._check_finished()
+        if not self.racers and self.tick_task is not None:
+            self.tick_task.cancel()
+            self.tick_task = None
+
+    def mark_ready(self, racer):
+        racer.ready = True
+        if self.racing:
+            # The countdown for the next race starts when this one ends
+            self.server.send(racer, encode({"type": "queued"}))
+        else:
+            self._schedule_countdown()
+
+    def _schedule_countdown(self):
+        if self.countdown is None:
+            loop = asyncio.get_running_loop()
+            self.countdown = loop.call_later(self.server.start_delay, self._start_race)
+            self.broadcast({"type": "countdown", "seconds": self.server.start_delay},
+                           self.racers.values())
+
+    def update_progress(self, racer, position):
+        if racer.racing and not racer.finished:
+            racer.position = max(0, min(int(position), len(self.text)))
+            self.changed.add(racer.id)
+
+    def finish(self, racer, wpm, accuracy):
+        if racer.racing and not racer.finished:
+            racer.finished = True
+            racer.wpm = int(wpm)
+            racer.accuracy = int(accuracy)
+            self.changed.add(racer.id)
+            self._check_finished()
+
+    def broadcast(self, message, racers, droppable=False):
+        """Encode once and queue the same bytes for every racer"""
+        data = encode(message)
+        for racer in racers:
+            self.server.send(racer, data, droppable)
+
+    def _start_race(self):
+        self.countdown = None
+        ready = [racer for racer in self.racers.values() if racer.ready]
+        if not ready:
+            return
+        self.text = typing_engine.generate_text(self.server.difficulty)
+        self.started_at = time.monotonic()
+        self.changed.clear()
+        for racer in ready:
+            racer.ready = False
+            racer.racing = True
+            racer.position = 0
+            racer.finished = False
+            racer.stale = False
+        self.broadcast({
+            "type": "start",
+            "text": self.text,
+            "time_limit": self.server.time_limit,
+            "racers": [[racer.id, racer.name] for racer in ready],
+        }, ready)
+
+    def _check_finished(self):
+        racers = self.participants()
+        if self.racing and all(racer.finished for racer in racers):
+            self._end_race()
+
+    def _end_race(self):
+        racers = self.participants()
+        standings = sorted(racers, key=lambda r: (not r.finished, -r.wpm, -r.position))
+        self.broadcast({
+            "type": "results",
+            "standings": [[r.id, r.name, r.wpm, r.accuracy, r.position] for r in standings],
+        }, racers)
+        for racer in racers:
+            racer.racing = False
+        self.text = None
+        self.changed.clear()
+        if any(racer.ready for racer in self.racers.values()):
+            self._schedule_countdown()
+
+    async def _tick_loop(self):
+        interval = self.server.tick_interval
+        grace = 5
+        while True:
+            await asyncio.sleep(interval)
+            if not self.racing:
+                continue
+            if time.monotonic() - self.started_at > self.server.time_limit + grace:
+                self._end_race()
+                continue
+            racers = self.participants()
+            if self.changed:
+                positions = {r.id: [r.position, r.finished] for r in
+                             (self.racers[i] for i in self.changed if i in self.racers)}
+                self.changed.clear()
+                data = encode({"type": "state", "positions": positions})
+                for racer in racers:
+                    if racer.stale:
+                        continue
+                    self.server.send(racer, data, droppable=True)
+            # Racers that fell behind get one full snapshot once they catch up
+            stale = [racer for racer in racers if racer.stale and not self.server.congested(racer)]
+            if stale:
+                data = encode({"type": "state", "positions": {
+                    r.id: [r.position, r.finished] for r in racers
+                }})
+                for racer in stale:
+                    racer.stale = False
+                    self.server.send(racer, data, droppable=True)
+
+
+class RaceServer:
+    """Accepts racers and routes their messages to rooms"""
+
+    def __init__(self, difficulty="Medium", time_limit=120, tick_interval=0.1,
+                 start_delay=5.0, max_buffer=64 * 1024):
+        self.difficulty = difficulty
+        self.time_limit = time_limit
+        self.tick_interval = tick_interval
+        self.start_delay = start_delay
+        self.max_buffer = max_buffer
+        self.rooms = {}
+        self.next_id = 1
+
+    def congested(self, racer):
+        transport = racer.writer.transport
+        return transport.get_write_buffer_size() > self.max_buffer
+
+    def send(self, racer, data, droppable=False):
+        """Write to a racer; droppable state updates are skipped while its connection is backed up
+
+        Skipped state updates are superseded by a full snapshot later, so a
+        slow client never makes the server buffer an unbounded backlog.
+        Everything else (start, results, countdowns) is one message per
+        race and is always queued, since nothing would replay it.
+        """
+        if racer.writer.is_closing():
+            return
+        if droppable and self.congested(racer):
+            racer.stale = True
+            return
+        racer.writer.write(data)
+
+    async def handle(self, reader, writer):
+        racer = None
+        room = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    kind = message["type"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+                if kind == "join" and racer is None:
+                    racer = Racer(self.next_id, str(message.get("name", "racer"))[:32], writer)
+                    self.next_id += 1
+                    room_name = str(message.get("room", "lobby"))[:32]
+                    room = self.rooms.get(room_name)
+                    if room is None:
+                        room = self.rooms[room_name] = Room(room_name, self)
+                    room.add(racer)
+                    self.send(racer, encode({"type": "joined", "id": racer.id, "room": room.name}))
+                elif racer is None:
+                    continue
+                elif kind == "ready":
+                    room.mark_ready(racer)
+                elif kind == "progress":
+                    room.update_progress(racer, message.get("position", 0))
+                elif kind == "finish":
+                    room.finish(racer, message.get("wpm", 0), message.get("accuracy", 0))
+        except (ConnectionError, ValueError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            if racer is not None:
+                room.remove(racer)
+                if not room.racers:
+                    self.rooms.pop(room.name, None)
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE)
+        async with server:
+            await server.serve_forever()
+
+
+class RaceClient:
+    """Race connection for the Tk game, run on a background thread
+
+    Incoming messages are put on inbox for the UI to poll. Progress
+    reports are coalesced so at most one is sent per interval.
+    """
+
+    def __init__(self, host, port, room="lobby", name="player", interval=0.1):
+        self.host = host
+        self.port = port
+        self.room = room
+        self.name = name
+        self.interval = interval
+        self.inbox = queue.Queue()
+        self.loop = asyncio.new_event_loop()
+        self.writer = None
+        self.position = None
+        self.sent_position = None
+        self.flush_handle = None
+        self.thread = threading.Thread(target=self._run, name="race-client", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.close()
+
+    async def _main(self):
+        try:
+            reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=1 << 20)
+            self._write({"type": "join", "room": self.room, "name": self.name})
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.inbox.put(json.loads(line))
+        except (OSError, ValueError) as exc:
+            self.inbox.put({"type": "error", "message": str(exc)})
+        self.inbox.put({"type": "disconnected"})
+
+    def _write(self, message):
+        if self.writer is not None and not self.writer.is_closing():
+            self.writer.write(encode(message))
+
+    def _call(self, callback, *args):
+        """Run callback on the connection's loop; a no-op once the connection has ended"""
+        if self.loop.is_closed():
+            return
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # The loop closed between the check and the call
+            pass
+
+    def send(self, message):
+        """Send a message from any thread"""
+        self._call(self._write, message)
+
+    def report_progress(self, position):
+        """Record the latest position; it is sent on the next interval"""
+        self.position = position
+        self._call(self._schedule_progress)
+
+    def _schedule_progress(self):
+        if self.flush_handle is None:
+            self.flush_handle = self.loop.call_later(self.interval, self._flush_progress)
+
+    def _flush_progress(self):
+        self.flush_handle = None
+        if self.position != self.sent_position:
+            self.sent_position = self.position
+            self._write({"type": "progress", "position": self.position})
+
+    def finish(self, position, wpm, accuracy):
+        """Send the final position immediately, then the result"""
+        def send_final():
+            if self.flush_handle is not None:
+                self.flush_handle.cancel()
+                self.flush_handle = None
+            self.position = self.sent_position = position
+            self._write({"type": "progress", "position": position})
+            self._write({"type": "finish", "wpm": wpm, "accuracy": accuracy})
+        self._call(send_final)
+
+    def close(self):
+        def shutdown():
+            if self.writer is not None:
+                self.writer.close()
+        self._call(shutdown)
+
+
+async def run_bot(host, port, room, name, wpm, error_rate, rounds, rng, stats):
+    """Headless racer that types the passage at roughly wpm"""
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+    writer.write(encode({"type": "join", "room": room, "name": name}))
+    writer.write(encode({"type": "ready"}))
+    typing_task = None
+
+    async def type_passage(text, time_limit):
+        session = TypingSession(text, time_limit)
+        session.start()
+        typed = ""
+        interval = 60 / (wpm * 5)
+        last_report = 0.0
+        while not session.finished:
+            await asyncio.sleep(interval * rng.uniform(0.5, 1.5))
+            position = len(typed)
+            if position and typed[-1] != text[position - 1] and rng.random() < 0.5:
+                typed = typed[:-1]
+            else:
+                typed += rng.choice("qwxz") if rng.random() < error_rate else text[position]
+            session.feed(typed)
+            now = time.monotonic()
+            if now - last_report >= 0.1:
+                last_report = now
+                writer.write(encode({"type": "progress", "position": session.position}))
+        result = session.result()
+        writer.write(encode({"type": "finish", "wpm": result.wpm, "accuracy": result.accuracy}))
+
+    try:
+        while rounds > 0:
+            line = await reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            stats["messages"] += 1
+            stats["bytes"] += len(line)
+            if message["type"] == "start":
+                typing_task = asyncio.ensure_future(type_passage(message["text"], message["time_limit"]))
+            elif message["type"] == "results":
+                stats["races"] += 1
+                rounds -= 1
+                if rounds > 0:
+                    writer.write(encode({"type": "ready"}))
+    finally:
+        if typing_task is not None:
+            typing_task.cancel()
+        writer.close()
+
+
+async def run_bots(args):
+    stats = {"messages": 0, "bytes": 0, "races": 0}
+    rng = random.Random(args.seed)
+    started = time.monotonic()
+    bots = [
+        run_bot(args.host, args.port, args.room, f"bot{i}", rng.uniform(args.min_wpm, args.max_wpm),
+                args.error_rate, args.rounds, random.Random(rng.random()), stats)
+        for i in range(args.count)
+    ]
+    results = await asyncio.gather(*bots, return_exceptions=True)
+    errors = [r for r in results if isinstance(r, Exception)]
+    elapsed = time.monotonic() - started
+    print(f"{args.count} bots, {stats['races']} races finished, {len(errors)} errors in {elapsed:.1f}s")
+    print(f"received {stats['messages']} messages ({stats['bytes'] / 1024:.0f} KiB)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Typing race server and load-test bots")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="run a race server")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--difficulty", default="Medium", choices=list(typing_engine.WORD_LISTS))
+    serve.add_argument("--time-limit", type=int, default=120)
+    serve.add_argument("--tick", type=float, default=0.1, help="seconds between position broadcasts")
+    serve.add_argument("--start-delay", type=float, default=5.0, help="countdown after the first racer is ready")
+
+    bots = sub.add_parser("bots", help="connect headless racers to a server")
+    bots.add_argument("--host", default="127.0.0.1")
+    bots.add_argument("--port", type=int, default=8765)
+    bots.add_argument("--room", default="lobby")
+    bots.add_argument("--count", type=int, default=100)
+    bots.add_argument("--rounds", type=int, default=1)
+    bots.add_argument("--min-wpm", type=float, default=30)
+    bots.add_argument("--max-wpm", type=float, default=120)
+    bots.add_argument("--error-rate", type=float, default=0.03)
+    bots.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "serve":
+            server = RaceServer(args.difficulty, args.time_limit, args.tick, args.start_delay)
+            asyncio.run(server.serve(args.host, args.port))
+        else:
+            asyncio.run(run_bots(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1096 @@
+"""Headless game engine for the typing speed game
+
+Everything here is plain Python with no Tk dependency, so sessions can be
+scored on servers and in benchmarks without a display.
+"""
+import random
+import re
+import textwrap
+import time
+from array import array
+from bisect import bisect_right
+from collections import deque, namedtuple
+
+from corpus import Corpus
+
+# Word lists for different difficulty levels
+WORD_LISTS = {
+    "Easy": [
+        "cat", "dog", "run", "jump", "walk", "talk", "book", "read", "write", "play",
+        "game", "time", "work", "home", "food", "love", "life", "help", "good", "best",
+        "make", "take", "come", "look", "feel", "know", "think", "first", "last", "find",
+        "give", "hand", "part", "place", "right", "great", "small", "large", "world", "state"
+    ],
+    "Medium": [
+        "computer", "keyboard", "monitor", "programming", "development", "application", "function",
+        "variable", "language", "algorithm", "structure", "database", "network", "security",
+        "interface", "technology", "innovation", "creativity", "productivity", "efficiency",
+        "organization", "management", "communication", "collaboration", "implementation",
+        "optimization", "configuration", "documentation", "maintenance", "troubleshooting"
+    ],
+    "Hard": [
+        "extraordinary", "incomprehensible", "disproportionate", "responsibilities", "characteristics",
+        "administration", "transformation", "establishment", "implementation", "acknowledgment",
+        "representative", "infrastructure", "standardization", "internationalization",
+        "multidisciplinary", "telecommunications", "entrepreneurship", "simultaneously",
+        "consciousness", "philosophical", "psychological", "technological", "environmental",
+        "organizational", "constitutional", "revolutionary", "extraordinary", "fundamentally"
+    ]
+}
+
+SessionResult = namedtuple("SessionResult", "wpm accuracy elapsed_time rating")
+Keystroke = namedtuple("Keystroke", "timestamp position char correct kind")
+WordStat = namedtuple("WordStat", "word start time hesitation errors corrections")
+Rhythm = namedtuple("Rhythm", "keystrokes interval_mean interval_var bursts pauses")
+
+RECORDING_VERSION = 1
+
+# Keystroke gaps longer than this are pauses, not part of the typing rhythm
+PAUSE_INTERVAL = 2.0
+# A burst is at least BURST_KEYS keystrokes at most BURST_INTERVAL apart (~80 WPM)
+BURST_INTERVAL = 0.15
+BURST_KEYS = 8
+
+# Edit kinds recorded in the keystroke log
+EDIT_INSERT = 0   # single character typed
+EDIT_DELETE = 1   # character removed (backspace, delete, cut)
+EDIT_PASTE = 2    # character inserted as part of a multi-character edit
+
+
+# Built-in corpus used when no corpus file is loaded
+DEFAULT_CORPUS = Corpus.from_word_lists(WORD_LISTS)
+
+
+def generate_text(difficulty, rng=random, corpus=None):
+    """Generate random text based on difficulty level"""
+    if corpus is None:
+        corpus = DEFAULT_CORPUS
+
+    # Generate 50-80 words for the test
+    num_words = rng.randint(50, 80)
+    selected_words = corpus.sample(difficulty, num_words, rng)
+
+    return " ".join(selected_words)
+
+
+def endless_text(difficulty, rng=random, corpus=None):
+    """Endless stream of passages for marathon sessions"""
+    while True:
+        yield generate_text(difficulty, rng, corpus)
+
+
+def read_source(path):
+    """Lines of a source file for code typing, without trailing whitespace"""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        lines = [line.rstrip() for line in f.read().splitlines()]
+    if not any(lines):
+        raise ValueError(f"{path} has no code to type")
+    return lines
+
+
+def code_snippet(lines, max_lines=30, rng=random):
+    """A run of up to max_lines source lines with indentation and line breaks kept
+
+    Prefers to start at an unindented line so snippets begin at a
+    definition rather than mid-block. max_lines=None uses every line.
+    """
+    if max_lines is None or len(lines) <= max_lines:
+        chunk = lines
+    else:
+        last = len(lines) - max_lines
+        starts = [i for i in range(last + 1) if lines[i] and not lines[i][0].isspace()]
+        if not starts:
+            starts = [i for i in range(last + 1) if lines[i]] or [0]
+        start = rng.choice(starts)
+        chunk = lines[start:start + max_lines]
+    return textwrap.dedent("\n".join(chunk)).strip("\n")
+
+
+def calculate_wpm(correct_chars, elapsed_time):
+    """Words per minute from correctly typed characters (5 chars per word)"""
+    if elapsed_time <= 0:
+        return 0
+    words_typed = correct_chars / 5  # Average word length
+    return int((words_typed / elapsed_time) * 60)
+
+
+def calculate_accuracy(correct_chars, total_chars):
+    """Accuracy as a whole percentage"""
+    if total_chars <= 0:
+        return 0
+    return int((correct_chars / total_chars) * 100)
+
+
+def get_performance_rating(wpm, accuracy):
+    """Get performance rating based on WPM and accuracy"""
+    if wpm >= 60 and accuracy >= 95:
+        return "🏆 Excellent! Professional level typing!"
+    elif wpm >= 40 and accuracy >= 90:
+        return "🥇 Great! Above average typing skills!"
+    elif wpm >= 25 and accuracy >= 80:
+        return "🥈 Good! Average typing skills!"
+    elif wpm >= 15 and accuracy >= 70:
+        return "🥉 Fair! Keep practicing!"
+    else:
+        return "📚 Beginner! Practice more to improve!"
+
+
+def common_prefix_length(a, b):
+    """Length of the common prefix of two strings
+
+    Uses slice comparisons in a binary search so the per-character work
+    happens inside the interpreter's string compare instead of a Python loop.
+    """
+    # Appends and backspaces: one string is a prefix of the other, which
+    # startswith confirms without copying either string
+    if len(a) <= len(b):
+        if b.startswith(a):
+            return len(a)
+    elif a.startswith(b):
+        return len(b)
+    lo, hi = 0, min(len(a), len(b))
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+def common_suffix_length(a, b):
+    """Length of the common suffix of two strings"""
+    n = min(len(a), len(b))
+    if a[len(a) - n:] == b[len(b) - n:]:
+        return n
+    lo, hi = 0, n
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if a[len(a) - mid:len(a) - lo] == b[len(b) - mid:len(b) - lo]:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+class IncrementalScorer:
+    """Keep per-position match state and re-score only what an edit changed"""
+
+    def __init__(self, target=""):
+        self.reset(target)
+
+    def reset(self, target):
+        """Start scoring against a new target text"""
+        self.target = target
+        self.typed = ""
+        self.matches = bytearray()
+        self.correct_chars = 0
+        self.marks_changed = (0, 0)
+
+    @property
+    def total_chars(self):
+        return len(self.typed)
+
+    @property
+    def marks(self):
+        """Per target character before the cursor: 1 typed correctly, 0 not"""
+        return self.matches
+
+    @property
+    def cursor(self):
+        """Target position of the next character to type"""
+        return len(self.typed)
+
+    def is_correct(self, index):
+        """Whether the character typed at index matches the target"""
+        return bool(self.matches[index])
+
+    def update(self, typed, edit_start=None):
+        """Apply the new input text and return the (start, end) range re-scored
+
+        Appends and backspaces only touch the characters they add or remove.
+        Edits in the middle shift every later character, so those positions
+        are re-scored as well. Callers that already know where the edit began
+        can pass edit_start to skip locating it.
+        """
+        old = self.typed
+        if typed == old:
+            self.marks_changed = (len(typed), len(typed))
+            return self.marks_changed
+
+        if edit_start is None:
+            start = common_prefix_length(old, typed)
+        else:
+            start = min(edit_start, len(old), len(typed))
+
+        old_len = len(old)
+        new_len = len(typed)
+        if old_len == new_len:
+            # Same length: positions stay aligned so the unchanged tail is kept
+            end = new_len - common_suffix_length(old[start:], typed[start:])
+        else:
+            end = max(old_len, new_len)
+
+        old_end = min(end, old_len)
+        self.correct_chars -= self.matches.count(1, start, old_end)
+
+        new_end = min(end, new_len)
+        target = self.target
+        scored = bytearray(
+            1 if i < len(target) and typed[i] == target[i] else 0
+            for i in range(start, new_end)
+        )
+        self.correct_chars += scored.count(1)
+        self.matches[start:old_end] = scored
+
+        self.typed = typed
+        self.marks_changed = (start, end)
+        return (start, end)
+
+    def extend(self, more):
+        """Append text to the target"""
+        self.target += more
+
+    def trim(self, count):
+        """Drop the first count characters of both target and input"""
+        self.correct_chars -= self.matches.count(1, 0, count)
+        del self.matches[:count]
+        self.typed = self.typed[count:]
+        self.target = self.target[count:]
+
+
+INFINITE_COST = 1 << 30
+
+
+class AlignmentScorer:
+    """Score input by its cheapest alignment to the target
+
+    A skipped or doubled character costs one error instead of putting every
+    later character out of step. One row of an edit-distance table is kept
+    per typed character, limited to a band of 2 * band + 1 target positions
+    that follows the cheapest cell of the row before, so typing or deleting
+    a character computes at most one new row. The best path is traced back
+    only until it rejoins the previous one, usually within a few rows.
+
+    matches holds one entry per typed character (1 when aligned to the same
+    target character) and marks one per target character before the cursor
+    (1 typed correctly, 0 mistyped or skipped). Skipped target characters
+    count toward total_chars, so they cost accuracy like any other error.
+    The target is fixed: there is no extend or trim.
+    """
+
+    def __init__(self, target="", band=8):
+        self.band = band
+        self.width = 2 * band + 1
+        self.reset(target)
+
+    def reset(self, target):
+        """Start scoring against a new target text"""
+        self.target = target
+        self.typed = ""
+        self.matches = bytearray()
+        self.marks = bytearray()
+        self.correct_chars = 0
+        self.aligned = 0  # typed characters aligned to some target character
+        self.cursor = 0
+        self.marks_changed = (0, 0)
+
+        # Row 0: reaching target position j without typing skips j characters
+        width = self.width
+        self.lows = array("I", [0])
+        self.rows = array("I", [j if j <= len(target) else INFINITE_COST for j in range(width)])
+        # Best path: target position where it enters each row, and whether
+        # it entered diagonally (typed character aligned to a target one)
+        self.entry = array("I", [0])
+        self.diag = bytearray(1)
+
+    @property
+    def total_chars(self):
+        return len(self.typed) + self.cursor - self.aligned
+
+    def is_correct(self, index):
+        """Whether the character typed at index matches the target"""
+        return bool(self.matches[index])
+
+    def cell(self, i, j):
+        """Alignment cost of typed[:i] against target[:j]"""
+        k = j - self.lows[i]
+        if 0 <= k < self.width:
+            return self.rows[i * self.width + k]
+        return INFINITE_COST
+
+    def _add_row(self, char):
+        width = self.width
+        target = self.target
+        last = len(target)
+        previous_low = self.lows[-1]
+        previous = self.rows[-width:]
+
+        # Centre the band one step past the cheapest cell of the previous row
+        best = min(previous)
+        centre = previous_low + width - 1 - previous[::-1].index(best) + 1
+        low = max(0, centre - self.band)
+
+        row = array("I", [INFINITE_COST]) * width
+        for k in range(min(width, last - low + 1)):
+            j = low + k
+            p = j - previous_low
+            cost = previous[p] + 1 if 0 <= p < width else INFINITE_COST
+            if j > 0 and 0 < p <= width:
+                diagonal = previous[p - 1] + (char != target[j - 1])
+                if diagonal < cost:
+                    cost = diagonal
+            if k > 0 and row[k - 1] + 1 < cost:
+                cost = row[k - 1] + 1
+            row[k] = min(cost, INFINITE_COST)
+        self.lows.append(low)
+        self.rows.extend(row)
+
+    def update(self, typed, edit_start=None):
+        """Apply the new input text and return the (start, end) range of input re-scored
+
+        marks_changed is set to the range of marks that may have changed.
+        """
+        old = self.typed
+        if typed == old:
+            self.marks_changed = (self.cursor, self.cursor)
+            return (len(typed), len(typed))
+
+        if edit_start is None:
+            start = common_prefix_length(old, typed)
+        else:
+            start = min(edit_start, len(old), len(typed))
+
+        # Rows up to start only depend on input that did not change
+        width = self.width
+        del self.rows[(start + 1) * width:]
+        del self.lows[start + 1:]
+        for i in range(start, len(typed)):
+            self._add_row(typed[i])
+        self.typed = typed
+
+        # Cheapest alignment of all the input, preferring the furthest position
+        n = len(typed)
+        low = self.lows[n]
+        last_row = self.rows[n * width:]
+        cursor = low + width - 1 - last_row[::-1].index(min(last_row))
+
+        # Trace back until the path rejoins the old one at an unchanged row
+        target = self.target
+        cell = self.cell
+        entries = []
+        i, j = n, cursor
+        while True:
+            diagonal = False
+            while i > 0:
+                cost = cell(i, j)
+                if j > 0 and cell(i - 1, j - 1) + (typed[i - 1] != target[j - 1]) == cost:
+                    diagonal = True
+                    break
+                if cell(i - 1, j) + 1 == cost:
+                    break
+                j -= 1
+            else:
+                j = 0
+            if i <= start and i < len(self.entry) and self.entry[i] == j:
+                break
+            entries.append((j, diagonal))
+            i -= 1
+            j -= diagonal
+
+        # Re-derive matches and marks for the rows after the join
+        joined = i
+        self.correct_chars -= self.matches.count(1, joined)
+        self.aligned -= self.diag.count(1, joined + 1)
+        del self.entry[joined + 1:]
+        del self.diag[joined + 1:]
+        for j, diagonal in reversed(entries):
+            self.entry.append(j)
+            self.diag.append(diagonal)
+
+        first_mark = self.entry[joined]
+        matches = bytearray(n - joined)
+        marks = bytearray(cursor - first_mark)
+        for i in range(joined, n):
+            if self.diag[i + 1]:
+                j = self.entry[i + 1] - 1
+                if typed[i] == target[j]:
+                    matches[i - joined] = 1
+                    marks[j - first_mark] = 1
+        self.matches[joined:] = matches
+        self.marks[first_mark:] = marks
+        self.correct_chars += matches.count(1)
+        self.aligned += self.diag.count(1, joined + 1)
+
+        self.marks_changed = (first_mark, max(cursor, self.cursor))
+        self.cursor = cursor
+        return (start, max(len(old), n))
+
+
+class KeystrokeLog:
+    """Per-character edit history stored in parallel typed arrays
+
+    Each event costs 18 bytes instead of a dict or tuple per keystroke.
+    Once max_events is reached the oldest quarter of the log is dropped,
+    so multi-hour sessions stay within a fixed footprint; dropped counts
+    how many events were discarded that way.
+    """
+
+    def __init__(self, max_events=1_000_000):
+        self.max_events = max_events
+        self.dropped = 0
+        self.clear()
+
+    def clear(self):
+        self.timestamps = array("d")
+        self.positions = array("I")
+        self.chars = array("I")
+        self.correct = array("B")
+        self.kinds = array("B")
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        return Keystroke(
+            self.timestamps[index],
+            self.positions[index],
+            chr(self.chars[index]),
+            bool(self.correct[index]),
+            self.kinds[index],
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def nbytes(self):
+        """Memory used by the event arrays"""
+        return sum(
+            column.itemsize * len(column)
+            for column in (self.timestamps, self.positions, self.chars, self.correct, self.kinds)
+        )
+
+    def append(self, timestamp, position, char, correct, kind):
+        if len(self.timestamps) >= self.max_events:
+            self._drop_oldest(max(1, self.max_events // 4))
+        self.timestamps.append(timestamp)
+        self.positions.append(position)
+        self.chars.append(ord(char))
+        self.correct.append(1 if correct else 0)
+        self.kinds.append(kind)
+
+    def _drop_oldest(self, count):
+        for column in (self.timestamps, self.positions, self.chars, self.correct, self.kinds):
+            del column[:count]
+        self.dropped += count
+
+    def to_dict(self):
+        """JSON-friendly columns of the log"""
+        return {
+            "timestamps": self.timestamps.tolist(),
+            "positions": self.positions.tolist(),
+            "chars": "".join(map(chr, self.chars)),
+            "kinds": self.kinds.tolist(),
+            "dropped": self.dropped,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        log = cls()
+        log.timestamps = array("d", data["timestamps"])
+        log.positions = array("I", data["positions"])
+        log.chars = array("I", map(ord, data["chars"]))
+        log.kinds = array("B", data["kinds"])
+        log.correct = array("B", bytes(len(log.kinds)))
+        log.dropped = data.get("dropped", 0)
+        return log
+
+    def edits(self):
+        """Rebuild the input text, yielding (timestamp, typed) after each edit
+
+        Events sharing a timestamp came from the same input change and are
+        applied together.
+        """
+        if self.dropped:
+            raise ValueError("log is truncated; the input cannot be rebuilt")
+        chars = []
+        timestamps = self.timestamps
+        i = 0
+        while i < len(timestamps):
+            timestamp = timestamps[i]
+            while i < len(timestamps) and timestamps[i] == timestamp:
+                if self.kinds[i] == EDIT_DELETE:
+                    del chars[self.positions[i]]
+                else:
+                    chars.insert(self.positions[i], chr(self.chars[i]))
+                i += 1
+            yield timestamp, "".join(chars)
+
+    def record_edit(self, timestamp, old, new, start, matches, base=0):
+        """Log the characters removed and inserted by one input change
+
+        base is added to logged positions when old and new are a window
+        into a longer text. Returns (inserted, correct) character counts.
+        """
+        suffix = common_suffix_length(old[start:], new[start:])
+        removed = old[start:len(old) - suffix]
+        inserted = new[start:len(new) - suffix]
+
+        # Deletions are logged from the end, the order backspace removes them
+        for offset in range(len(removed) - 1, -1, -1):
+            self.append(timestamp, base + start + offset, removed[offset], False, EDIT_DELETE)
+
+        kind = EDIT_INSERT if len(inserted) == 1 else EDIT_PASTE
+        correct = 0
+        for offset, char in enumerate(inserted):
+            position = start + offset
+            correct += matches[position]
+            self.append(timestamp, base + position, char, matches[position], kind)
+        return len(inserted), correct
+
+
+SpeedSample = namedtuple("SpeedSample", "timestamp raw_wpm net_wpm accuracy")
+
+
+class RollingMetrics:
+    """Live WPM and accuracy over the last few seconds of typing
+
+    Keystroke batches go into a fixed-size ring buffer with running sums
+    for the characters inside the window, so adding an event and reading
+    the rates are O(1) (amortised over expiring old events). Raw WPM
+    counts every character typed, net WPM only the correct ones. A
+    snapshot is taken every sample_interval seconds into series, which a
+    live speed graph can read without rescanning the history.
+    """
+
+    def __init__(self, window=10.0, capacity=4096, sample_interval=1.0, history=3600):
+        self.window = window
+        self.capacity = capacity
+        self.sample_interval = sample_interval
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.typed = array("I", bytes(4 * capacity))
+        self.correct = array("I", bytes(4 * capacity))
+        self.head = 0
+        self.size = 0
+        self.window_typed = 0
+        self.window_correct = 0
+        self.start_time = None
+        self.next_sample = None
+        self.series = deque(maxlen=history)
+
+    def start(self, timestamp):
+        self.start_time = timestamp
+        self.next_sample = timestamp + self.sample_interval
+
+    def add(self, timestamp, typed, correct):
+        """Record typed characters, correct of them matching, at timestamp"""
+        if self.start_time is None:
+            self.start(timestamp)
+        if self.size == self.capacity:
+            self._evict()
+        index = (self.head + self.size) % self.capacity
+        self.timestamps[index] = timestamp
+        self.typed[index] = typed
+        self.correct[index] = correct
+        self.size += 1
+        self.window_typed += typed
+        self.window_correct += correct
+        self.sample(timestamp)
+
+    def _evict(self):
+        head = self.head
+        self.window_typed -= self.typed[head]
+        self.window_correct -= self.correct[head]
+        self.head = (head + 1) % self.capacity
+        self.size -= 1
+
+    def _expire(self, now):
+        cutoff = now - self.window
+        while self.size and self.timestamps[self.head] < cutoff:
+            self._evict()
+
+    def _span(self, now):
+        # Early in the session the window is only as long as the session,
+        # but never shorter than a second to avoid wild first readings
+        if self.start_time is None:
+            return self.window
+        return max(1.0, min(self.window, now - self.start_time))
+
+    def raw_wpm(self, now):
+        self._expire(now)
+        return int((self.window_typed / 5) / self._span(now) * 60)
+
+    def net_wpm(self, now):
+        self._expire(now)
+        return int((self.window_correct / 5) / self._span(now) * 60)
+
+    def accuracy(self, now):
+        """Accuracy of the characters typed within the window"""
+        self._expire(now)
+        if not self.window_typed:
+            return 0
+        return int((self.window_correct / self.window_typed) * 100)
+
+    def sample(self, now):
+        """Append snapshots to series for every sample interval that has passed"""
+        if self.next_sample is None or now < self.next_sample:
+            return
+        snapshot = SpeedSample(now, self.raw_wpm(now), self.net_wpm(now), self.accuracy(now))
+        while self.next_sample <= now:
+            self.next_sample += self.sample_interval
+        self.series.append(snapshot)
+
+
+WORD_PATTERN = re.compile(r"\S+")
+
+
+class WordIndex:
+    """Start and end offsets of every word in a passage, for bisecting positions
+
+    Built in one pass when the passage is set and extended as endless text
+    streams in, so keystrokes are mapped to words without re-splitting the
+    text. Offsets are absolute; words stay indexed after the window trims
+    them, which costs a few bytes per word.
+    """
+
+    def __init__(self, text="", base=0):
+        self.words = []
+        self.starts = array("I")
+        self.ends = array("I")
+        self.extend(text, base)
+
+    def __len__(self):
+        return len(self.words)
+
+    def extend(self, text, base):
+        """Index the words of text, which starts at absolute offset base"""
+        for match in WORD_PATTERN.finditer(text):
+            self.words.append(match.group())
+            self.starts.append(base + match.start())
+            self.ends.append(base + match.end())
+
+    def word_at(self, position):
+        """Index of the word at position, or of the word before the whitespace there (-1 if none)"""
+        return bisect_right(self.starts, position) - 1
+
+
+class TypingSession:
+    """One game: a passage, a time limit and the input typed against it
+
+    Timestamps are seconds on a monotonic clock. They default to the
+    session's clock, but recorded sessions can be replayed by passing the
+    original timestamps explicitly.
+
+    Given a text_source iterator the session is endless: more text is
+    pulled from it as the typist nears the end of the window (refill) and
+    typed text is committed and dropped from the front (trim), so the
+    window and the scoring state stay bounded however long it runs.
+    Positions reported by the session are absolute; text and the ranges
+    returned by feed are relative to the current window.
+
+    scoring="aligned" scores fixed passages with an AlignmentScorer, so a
+    skipped or doubled character is one error rather than a shifted tail.
+    """
+
+    def __init__(self, text, time_limit=120, difficulty="Easy", clock=time.monotonic,
+                 max_log_events=1_000_000, text_source=None, scoring="positional"):
+        self.time_limit = time_limit
+        self.difficulty = difficulty
+        self.clock = clock
+        self.scoring = scoring
+        if scoring == "aligned":
+            if text_source is not None:
+                raise ValueError("aligned scoring needs a fixed passage")
+            self.scorer = AlignmentScorer(text)
+        elif scoring == "positional":
+            self.scorer = IncrementalScorer(text)
+        else:
+            raise ValueError(f"unknown scoring {scoring!r}")
+        self.log = KeystrokeLog(max_log_events)
+        self.metrics = RollingMetrics()
+        self.words = WordIndex(text)
+        self.text_source = text_source
+        self.offset = 0  # characters trimmed from the front of the window
+        self.committed_correct = 0
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def text(self):
+        """Text of the current window"""
+        return self.scorer.target
+
+    @property
+    def endless(self):
+        return self.text_source is not None
+
+    @property
+    def correct_chars(self):
+        return self.committed_correct + self.scorer.correct_chars
+
+    @property
+    def total_chars(self):
+        return self.offset + self.scorer.total_chars
+
+    @property
+    def position(self):
+        return self.offset + len(self.scorer.typed)
+
+    @property
+    def started(self):
+        return self.start_time is not None
+
+    @property
+    def finished(self):
+        return self.end_time is not None
+
+    @property
+    def completed(self):
+        """Whether the whole passage has been typed"""
+        return not self.endless and self.scorer.cursor >= len(self.text)
+
+    def start(self, timestamp=None):
+        """Start the clock"""
+        self.start_time = self.clock() if timestamp is None else timestamp
+        self.end_time = None
+        self.metrics.start(self.start_time)
+
+    def feed(self, typed, timestamp=None, edit_start=None):
+        """Score the current input text and return the (start, end) range of marks changed
+
+        Finishes the session once the passage is complete or the time limit
+        has passed.
+        """
+        if self.finished:
+            return (self.position, self.position)
+        if timestamp is None:
+            timestamp = self.clock()
+        if not self.started:
+            self.start(timestamp)
+        if self.remaining_time(timestamp) <= 0:
+            # Input arriving after the deadline does not count
+            self.finish(timestamp)
+            return (self.position, self.position)
+
+        old = self.scorer.typed
+        changed = self.scorer.update(typed, edit_start)
+        if changed[0] != changed[1]:
+            inserted, correct = self.log.record_edit(
+                timestamp, old, typed, changed[0], self.scorer.matches, self.offset
+            )
+            if inserted:
+                self.metrics.add(timestamp, inserted, correct)
+        if self.completed:
+            self.finish(timestamp)
+        return self.scorer.marks_changed
+
+    def refill(self, lookahead=300):
+        """Pull more text once fewer than lookahead untyped characters remain
+
+        Returns the text appended to the window (empty if none was needed).
+        """
+        if not self.endless:
+            return ""
+        added = []
+        remaining = len(self.text) - len(self.scorer.typed)
+        while remaining < lookahead:
+            chunk = next(self.text_source, None)
+            if not chunk:
+                break
+            chunk = (" " if self.text or added else "") + chunk
+            added.append(chunk)
+            remaining += len(chunk)
+        more = "".join(added)
+        if more:
+            self.words.extend(more, self.offset + len(self.text))
+            self.scorer.extend(more)
+        return more
+
+    def trim(self, keep_behind=40, threshold=400):
+        """Commit and drop typed text once the window holds threshold characters
+
+        Cuts at a word boundary at least keep_behind characters behind the
+        cursor so recent mistakes can still be corrected. Returns how many
+        characters were dropped from the front of the window.
+        """
+        typed_length = len(self.scorer.typed)
+        if not self.endless or typed_length < threshold:
+            return 0
+        cut = self.text.rfind(" ", 0, typed_length - keep_behind) + 1
+        if cut <= 0:
+            return 0
+        before = self.scorer.correct_chars
+        self.scorer.trim(cut)
+        self.committed_correct += before - self.scorer.correct_chars
+        self.offset += cut
+        return cut
+
+    def finish(self, timestamp=None):
+        """Stop the clock; the final stats are frozen from here on"""
+        if self.finished:
+            return
+        if timestamp is None:
+            timestamp = self.clock()
+        if self.started and self.time_limit:
+            timestamp = min(timestamp, self.start_time + self.time_limit)
+        self.end_time = timestamp
+
+    def elapsed_time(self, now=None):
+        """Seconds since the session started, up to its end"""
+        if not self.started:
+            return 0.0
+        if self.finished:
+            return self.end_time - self.start_time
+        if now is None:
+            now = self.clock()
+        return max(0.0, now - self.start_time)
+
+    def remaining_time(self, now=None):
+        """Seconds left before the time limit"""
+        if not self.time_limit:
+            return float("inf")
+        return max(0.0, self.time_limit - self.elapsed_time(now))
+
+    def wpm(self, now=None):
+        return calculate_wpm(self.correct_chars, self.elapsed_time(now))
+
+    def accuracy(self):
+        return calculate_accuracy(self.correct_chars, self.total_chars)
+
+    def live_wpm(self, now=None):
+        """Net WPM over the rolling window rather than the whole session"""
+        if now is None:
+            now = self.clock()
+        self.metrics.sample(now)
+        return self.metrics.net_wpm(now)
+
+    def progress(self):
+        """Percentage of the passage typed (None for endless sessions)"""
+        if self.endless:
+            return None
+        if not self.text:
+            return 0
+        return int(((self.offset + self.scorer.cursor) / len(self.text)) * 100)
+
+    def result(self, now=None):
+        """Final (or live, if still running) WPM, accuracy, time and rating"""
+        wpm = self.wpm(now)
+        accuracy = self.accuracy()
+        return SessionResult(wpm, accuracy, self.elapsed_time(now), get_performance_rating(wpm, accuracy))
+
+
+def word_stats(session):
+    """[WordStat] for every word the session's keystroke log touched, in passage order
+
+    Each keystroke is charged the gap since the keystroke before it and
+    belongs to the word at its position, whitespace going with the word
+    before it, so per-word times add up to the typing time. hesitation is
+    the gap before a word's first keystroke. Aligned sessions get no
+    breakdown: their log holds input positions, which stop matching the
+    passage after a skipped or doubled key.
+    """
+    if session.scoring != "positional":
+        return []
+    index = session.words
+    starts = index.starts
+    log = session.log
+    positions = log.positions
+    timestamps = log.timestamps
+    kinds = log.kinds
+    correct = log.correct
+
+    totals = {}
+    previous = session.start_time if session.start_time is not None else 0.0
+    word = -1
+    low = high = 0  # positions covered by word, to skip most bisects
+    for i in range(len(log)):
+        position = positions[i]
+        if not low <= position < high:
+            word = index.word_at(position)
+            low = starts[word] if word >= 0 else 0
+            high = starts[word + 1] if word + 1 < len(starts) else 1 << 32
+        timestamp = timestamps[i]
+        gap = max(0.0, timestamp - previous)
+        previous = timestamp
+        if word < 0:
+            continue
+        entry = totals.get(word)
+        if entry is None:
+            entry = totals[word] = [0.0, gap, 0, 0]
+        entry[0] += gap
+        if kinds[i] == EDIT_DELETE:
+            entry[3] += 1
+        elif not correct[i]:
+            entry[2] += 1
+
+    return [
+        WordStat(index.words[word], starts[word], time, hesitation, errors, corrections)
+        for word, (time, hesitation, errors, corrections) in sorted(totals.items())
+    ]
+
+
+def slowest_words(stats, count=5):
+    """The count WordStats with the most time per character, slowest first"""
+    return sorted(stats, key=lambda stat: stat.time / (len(stat.word) + 1), reverse=True)[:count]
+
+
+def rhythm(session):
+    """Rhythm of the session's keystrokes: inter-key interval mean and variance, bursts and pauses
+
+    Pasted characters are not keystrokes, nor are the extra characters of
+    a multi-character deletion. Pauses are left out of the interval
+    statistics so one long break does not swamp the variance.
+    """
+    log = session.log
+    timestamps = log.timestamps
+    kinds = log.kinds
+    keystrokes = bursts = pauses = run = count = 0
+    mean = m2 = 0.0
+    previous = None
+    for i in range(len(log)):
+        timestamp = timestamps[i]
+        if kinds[i] == EDIT_PASTE or timestamp == previous:
+            # Characters from one edit share its keystroke
+            continue
+        keystrokes += 1
+        if previous is not None:
+            interval = timestamp - previous
+            if interval > PAUSE_INTERVAL:
+                pauses += 1
+            else:
+                # Welford's running mean and variance
+                count += 1
+                delta = interval - mean
+                mean += delta / count
+                m2 += delta * (interval - mean)
+            if interval <= BURST_INTERVAL:
+                run += 1
+            else:
+                bursts += run + 1 >= BURST_KEYS
+                run = 0
+        previous = timestamp
+    bursts += run + 1 >= BURST_KEYS
+    return Rhythm(keystrokes, mean, m2 / count if count else 0.0, bursts, pauses)
+
+
+def session_to_recording(session, **metadata):
+    """Everything needed to re-score a fixed-passage session later"""
+    if session.endless:
+        raise ValueError("endless sessions do not keep their full text")
+    recording = dict(metadata)
+    recording.update({
+        "version": RECORDING_VERSION,
+        "text": session.text,
+        "difficulty": session.difficulty,
+        "time_limit": session.time_limit,
+        "scoring": session.scoring,
+        "start_time": session.start_time,
+        "end_time": session.end_time,
+        "log": session.log.to_dict(),
+    })
+    return recording
+
+
+def replay_recording(recording):
+    """Re-run a recorded session through a fresh TypingSession"""
+    if recording.get("version") != RECORDING_VERSION:
+        raise ValueError(f"unsupported recording version {recording.get('version')!r}")
+    session = TypingSession(recording["text"], recording["time_limit"], recording["difficulty"],
+                            scoring=recording.get("scoring", "positional"))
+    session.start(recording["start_time"])
+    for timestamp, typed in KeystrokeLog.from_dict(recording["log"]).edits():
+        session.feed(typed, timestamp)
+        if session.finished:
+            break
+    if recording.get("end_time") is not None:
+        session.finish(recording["end_time"])
+    return session
+
+
+class GhostTrack:
+    """Input length over time for a recorded session, indexed by time
+
+    Built once from the keystroke log; position_at() is then a binary
+    search instead of replaying events from the start.
+    """
+
+    def __init__(self, text, times, positions, time_limit=0):
+        self.text = text
+        self.times = times
+        self.positions = positions
+        self.time_limit = time_limit
+
+    @classmethod
+    def from_recording(cls, recording):
+        log = KeystrokeLog.from_dict(recording["log"])
+        start = recording["start_time"]
+        times = array("d")
+        positions = array("I")
+        length = 0
+        for i in range(len(log)):
+            length += -1 if log.kinds[i] == EDIT_DELETE else 1
+            if times and times[-1] == log.timestamps[i] - start:
+                positions[-1] = length
+            else:
+                times.append(log.timestamps[i] - start)
+                positions.append(length)
+        return cls(recording["text"], times, positions, recording.get("time_limit", 0))
+
+    @property
+    def duration(self):
+        return self.times[-1] if self.times else 0.0
+
+    def position_at(self, elapsed):
+        """Characters typed elapsed seconds into the recording"""
+        index = bisect_right(self.times, elapsed) - 1
+        return self.positions[index] if index >= 0 else 0
+
+
+class GhostPlayer:
+    """Plays a GhostTrack against a clock at any speed, with seeking"""
+
+    def __init__(self, track, speed=1.0, clock=time.monotonic):
+        self.track = track
+        self.speed = speed
+        self.clock = clock
+        self.offset = 0.0  # recording time at the anchor
+        self.anchor = None  # clock time when playback last (re)started
+
+    @property
+    def playing(self):
+        return self.anchor is not None
+
+    def elapsed(self):
+        """Current position in recording seconds"""
+        if self.anchor is None:
+            return self.offset
+        return self.offset + (self.clock() - self.anchor) * self.speed
+
+    @property
+    def done(self):
+        return self.elapsed() >= self.track.duration
+
+    def play(self):
+        if self.anchor is None:
+            self.anchor = self.clock()
+
+    def pause(self):
+        self.offset = self.elapsed()
+        self.anchor = None
+
+    def seek(self, elapsed):
+        self.offset = max(0.0, min(elapsed, self.track.duration))
+        if self.anchor is not None:
+            self.anchor = self.clock()
+
+    def set_speed(self, speed):
+        playing = self.playing
+        self.pause()
+        self.speed = speed
+        if playing:
+            self.play()
+
+    def position(self):
+        return self.track.position_at(self.elapsed())